@@ -1,10 +1,16 @@
 import asyncio
+import hashlib
 import os
+import re
 import time
 import json
+import uuid
 
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from textwrap import dedent
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 
 import requests
@@ -18,6 +24,7 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END
 from langgraph.errors import GraphRecursionError
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from langchain_core.tools import StructuredTool
 from langgraph.graph.message import add_messages
 from typing import Annotated
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
@@ -41,9 +48,10 @@ class CSVAnalysisConfig:
     INSTRUCTIONS = dedent("""
 You are an intelligent **CSV Data Analyst Agent** with access to the following MCP tools:
 - get_files_list: List available CSV files.
-- read_file / read_file_list: Read a CSV file or list of files (≤100 rows for sampling).
+- sample_rows: Return a few rows of one or more CSVs (≤100 rows for sampling); `method` is head, uniform or stratified (with `by`).
 - get_schema: Return column names and data types of a CSV file.
-- execute_polars_sql: Execute a **single atomic Polars SQL query** on one or more CSVs with the same schema. Use `self` as the table name.
+- get_profile: Per-column statistics (nulls, min/max, distinct count, top values). When CONTEXT already lists column stats, use them instead of calling the tool.
+- execute_polars_sql: Execute a **single atomic Polars SQL query** on one or more CSVs with the same schema. Use `self` as the table name. Results come back in `rows`, capped per call; `truncated: true` means more rows exist, so aggregate or add LIMIT instead of selecting raw rows.
  2. **IMPORTANT PRE-CHECK**:
    - If there are **no files available** (`get_files_list` returns empty) **or** the schema (`get_schema`) is empty, you must **immediately respond with**:
      "**No file is present and there is nothing to analyze.**"
@@ -183,6 +191,11 @@ Would you like a year-over-year trend chart for these averages?
         self.client_secret = os.getenv('CLIENT_SECRET')
         self.model_id = os.getenv("MODEL_ID", "openai/gpt-oss-20b")
         self.api_key = os.getenv("GROQ_API_KEY")
+        self.mcp_pool_size = int(os.getenv("MCP_POOL_SIZE", "4"))
+        self.mcp_ping_interval = float(os.getenv("MCP_PING_INTERVAL", "30"))
+        self.mcp_session_max_age = float(os.getenv("MCP_SESSION_MAX_AGE", "3000"))
+        self.answer_cache_size = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+        self.profile_timeout = float(os.getenv("PROFILE_TIMEOUT_SECONDS", "2"))
 
         self._validate_config()
         self.mcp_url = self._construct_mcp_url()
@@ -200,33 +213,315 @@ Would you like a year-over-year trend chart for these averages?
         return f"https://bedrock-agentcore.{self.region}.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
 
 
+class TokenBroker:
+    """
+    Process-wide OAuth2 client-credentials token cache. The discovery document
+    is fetched once; a token is kept for its real `expires_in` and refreshed in
+    the background before it expires. Concurrent callers share one refresh.
+    """
+
+    refresh_fraction = 0.8  # refresh once this share of the token lifetime has passed
+    retry_seconds = 30
+
+    def __init__(self, discovery_url: str, client_id: str, client_secret: str):
+        self.discovery_url = discovery_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token_endpoint: Optional[str] = None
+        self._current: Tuple[Optional[str], float] = (None, 0.0)  # token and when it expires
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def get_token(self) -> str:
+        """A valid token; only blocks when none has been fetched yet or it already expired"""
+        return self.get_token_with_expiry()[0]
+
+    def get_token_with_expiry(self) -> Tuple[str, float]:
+        """A valid token and the time.time() at which it expires"""
+        token, expires_at = self._current
+        if token and time.time() < expires_at - 5:
+            return token, expires_at
+        return self._refresh()
+
+    def prefetch(self):
+        """Fetch the first token in the background so no request waits for it"""
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _refresh(self) -> Tuple[str, float]:
+        with self._lock:
+            # another caller may have refreshed while this one waited
+            if self._current[0] and time.time() < self._refresh_at:
+                return self._current
+            print("🔑 Getting fresh Bearer Token...")
+            try:
+                token_data = self._fetch_token()
+            except Exception:
+                self._token_endpoint = None  # re-read the discovery document next time
+                raise
+            lifetime = float(token_data.get('expires_in') or 3600)
+            now = time.time()
+            self._current = (token_data.get('access_token'), now + lifetime)
+            self._refresh_at = now + lifetime * self.refresh_fraction
+            self._schedule(self._refresh_at - now)
+            print("Token retrieved successfully.")
+            return self._current
+
+    def _fetch_token(self) -> Dict[str, Any]:
+        if self._token_endpoint is None:
+            response = requests.get(self.discovery_url, timeout=10)
+            response.raise_for_status()
+            self._token_endpoint = response.json().get('token_endpoint')
+
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        }
+
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        response = requests.post(self._token_endpoint, data=data, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 0), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"⚠️ Background token refresh failed: {e}")
+            with self._lock:
+                self._schedule(self.retry_seconds)
+
+
+_token_brokers: Dict[tuple, TokenBroker] = {}
+_token_brokers_lock = threading.Lock()
+
+
+def get_token_broker(discovery_url: str, client_id: str, client_secret: str) -> TokenBroker:
+    """The broker shared by every agent in this process for one set of client credentials"""
+    key = (discovery_url, client_id, client_secret)
+    with _token_brokers_lock:
+        if key not in _token_brokers:
+            _token_brokers[key] = TokenBroker(discovery_url, client_id, client_secret)
+        return _token_brokers[key]
+
+
 class AuthenticationManager:
     """Handles OAuth2 authentication"""
 
     def __init__(self, config: CSVAnalysisConfig):
         self.config = config
+        self.broker = get_token_broker(config.discovery_url, config.client_id, config.client_secret)
 
     def get_bearer_token(self) -> str:
-        """Gets a fresh access token using the Client Credentials Flow"""
-        print("🔑 Getting fresh Bearer Token...")
+        """Access token from the process-wide broker (Client Credentials Flow)"""
+        return self.broker.get_token()
 
-        response = requests.get(self.config.discovery_url, timeout=10)
-        response.raise_for_status()
-        token_endpoint = response.json().get('token_endpoint')
+    def get_bearer_token_with_expiry(self) -> Tuple[str, float]:
+        """Access token and the time.time() at which it expires"""
+        return self.broker.get_token_with_expiry()
 
-        data = {
-            'grant_type': 'client_credentials',
-            'client_id': self.config.client_id,
-            'client_secret': self.config.client_secret,
-        }
 
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+# tools and optimizer of the request running in the current task; read by cached workflows
+current_tools: ContextVar[Dict[str, Any]] = ContextVar("current_tools")
+current_optimizer: ContextVar["AgentOptimizer"] = ContextVar("current_optimizer")
 
-        response = requests.post(token_endpoint, data=data, headers=headers, timeout=10)
-        response.raise_for_status()
-        token_data = response.json()
-        print("Token retrieved successfully.")
-        return token_data.get('access_token')
+
+def tool_manifest_hash(tools: List) -> str:
+    """Hash of the tool names, descriptions and argument schemas a session offers"""
+    manifest = sorted(
+        (t.name, t.description or "", json.dumps(t.args, sort_keys=True, default=str))
+        for t in tools
+    )
+    return hashlib.sha256(json.dumps(manifest).encode("utf-8")).hexdigest()[:16]
+
+
+def routed_tool(tool) -> StructuredTool:
+    """Stand-in for an MCP tool that calls the same tool on the current request's session"""
+    async def call(**kwargs):
+        return await current_tools.get()[tool.name].coroutine(**kwargs)
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        coroutine=call,
+        response_format=tool.response_format,
+        metadata=tool.metadata,
+    )
+
+
+class PooledSession:
+    """One initialized MCP session, owned by a task on the pool's event loop"""
+
+    def __init__(self):
+        self.session: Optional[ClientSession] = None
+        self.tools: List = []
+        self.manifest = ""
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.token_expires_at = float("inf")  # time.time() at which the session's bearer token expires
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self, url: str, headers: Dict[str, str]):
+        """Connect, initialize and load the tools; raises if the handshake fails"""
+        self._task = asyncio.create_task(self._own(url, headers))
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def _own(self, url: str, headers: Dict[str, str]):
+        # the transport's cancel scopes must be entered and exited by the same task
+        try:
+            async with streamablehttp_client(url, headers, timeout=120) as (r, w, _):
+                async with ClientSession(r, w) as session:
+                    await session.initialize()
+                    self.tools = await load_mcp_tools(session)
+                    self.manifest = tool_manifest_hash(self.tools)
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and not self._task.done()
+
+    async def healthy(self, timeout: float = 5.0) -> bool:
+        """Ping the server; False when the session no longer answers"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5)
+            except Exception:
+                pass
+
+
+class MCPSessionPool:
+    """
+    Process-wide pool of initialized MCP sessions reused across invocations.
+    Sessions live on a background event loop; idle ones are pinged before
+    reuse and replaced when dead, failing, older than MCP_SESSION_MAX_AGE or
+    close to the expiry of the bearer token they were opened with.
+    """
+
+    token_expiry_margin = 60  # seconds before the token expires at which a session is retired
+
+    def __init__(self, config: CSVAnalysisConfig, auth_manager: AuthenticationManager):
+        self.config = config
+        self.auth_manager = auth_manager
+        self._idle: List[PooledSession] = []
+        self._slots = asyncio.Semaphore(config.mcp_pool_size)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-session-pool", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the pool's loop from synchronous code"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        """Run a coroutine on the pool's loop from synchronous code and wait for it"""
+        return self.submit(coro).result()
+
+    @asynccontextmanager
+    async def session(self):
+        """Borrow a healthy session; at most MCP_POOL_SIZE are in use at once"""
+        async with self._slots:
+            conn = await self._checkout()
+            try:
+                yield conn
+            finally:
+                conn.last_used = time.monotonic()
+                if conn.alive:
+                    self._idle.append(conn)
+                else:
+                    await conn.close()
+
+    async def _checkout(self) -> PooledSession:
+        while self._idle:
+            conn = self._idle.pop()
+            now = time.monotonic()
+            if (
+                now - conn.created > self.config.mcp_session_max_age
+                or time.time() > conn.token_expires_at - self.token_expiry_margin
+            ):
+                print("♻️ MCP session expired — reconnecting")
+            elif now - conn.last_used < self.config.mcp_ping_interval and conn.alive:
+                return conn
+            elif await conn.healthy():
+                return conn
+            else:
+                print("⚠️ MCP session failed health check — reconnecting")
+            await conn.close()
+        return await self._connect()
+
+    async def _connect(self, attempts: int = 2) -> PooledSession:
+        for attempt in range(attempts):
+            conn = PooledSession()
+            try:
+                bearer_token, conn.token_expires_at = await asyncio.to_thread(
+                    self.auth_manager.get_bearer_token_with_expiry
+                )
+                headers = {
+                    "authorization": f"Bearer {bearer_token}",
+                    "Content-Type": "application/json"
+                }
+                print("🔗 Opening pooled connection to MCP server...")
+                await conn.open(self.config.mcp_url, headers)
+                print("✅ MCP CONNECTION AND HANDSHAKE SUCCESSFUL (JWT)! ✅")
+                print("Discovering tools...")
+                for tool in conn.tools:
+                    name = getattr(tool, "name", "<unknown>")
+                    desc = (getattr(tool, "description", "") or "").strip()
+                    print(f"- {name} :: {desc}")
+                return conn
+            except Exception as e:
+                print(f"❌ MCP connection attempt {attempt + 1} failed: {e}")
+                await conn.close()
+                if attempt == attempts - 1:
+                    raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {"idle": len(self._idle), "max_size": self.config.mcp_pool_size}
+
+
+_session_pool: Optional[MCPSessionPool] = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> MCPSessionPool:
+    """The process-wide MCP session pool, created on first use"""
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            config = CSVAnalysisConfig()
+            _session_pool = MCPSessionPool(config, AuthenticationManager(config))
+        return _session_pool
 
 
 class AgentOptimizer:
@@ -236,6 +531,7 @@ class AgentOptimizer:
         self.user_id = user_id
         self._cached_file_path: str = ""
         self._cached_schema: Dict[str, str] = {}
+        self._cached_profile: Dict[str, str] = {}
 
     def create_optimized_pre_model_hook(self):
         """Inject cached context without altering existing messages"""
@@ -248,6 +544,9 @@ class AgentOptimizer:
             if self._cached_schema:
                 cols = ", ".join(self._cached_schema.keys())
                 context_parts.append(f"Columns: {cols}")
+            if self._cached_profile:
+                stats = "; ".join(f"{col}: {summary}" for col, summary in self._cached_profile.items())
+                context_parts.append(f"Column stats: {stats}")
 
             if context_parts:
                 ctx = " | ".join(context_parts)
@@ -294,6 +593,101 @@ class AgentOptimizer:
         return router_function
 
 
+class AnswerCache:
+    """
+    Answers to earlier questions, keyed by the dataset fingerprint and the
+    content words of the normalized question, in order. A question is
+    answered from the cache only when it has the same content words in the
+    same order as a cached one, so "top 5" never matches "top 10", an added
+    qualifier ("in east", "for online orders") makes a new question, and
+    neither do swapped operands ("customers by orders" / "orders by
+    customers") or a changed connective ("and" / "or", "not"). A changed
+    file has a new fingerprint and never matches.
+    """
+
+    # connectives and negations ("and", "or", "not", "without", ...) are content words
+    stopwords = frozenset(
+        "a an are by can do does each for from give have has i in is me "
+        "of on per please show tell the to what which who with".split()
+    )
+    synonyms = {
+        "highest": "top", "largest": "top", "biggest": "top", "most": "top", "best": "top", "maximum": "max",
+        "lowest": "bottom", "smallest": "bottom", "least": "bottom", "worst": "bottom", "minimum": "min",
+        "average": "avg", "mean": "avg", "total": "sum",
+    }
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def tokens(cls, question: str) -> List[str]:
+        """Lower-cased words without stopwords, with synonyms folded and plurals trimmed"""
+        tokens = []
+        for word in re.findall(r"[a-z]+|\d+(?:\.\d+)?", question.lower().replace("n't", " not")):
+            if word in cls.stopwords:
+                continue
+            word = cls.synonyms.get(word, word)
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            tokens.append(word)
+        return tokens
+
+    @classmethod
+    def key(cls, question: str) -> tuple:
+        """The question's content words, in order"""
+        return tuple(cls.tokens(question))
+
+    def lookup(self, fingerprint: str, question: str) -> Optional[str]:
+        """Cached answer of an earlier question with the same content words on this dataset"""
+        key = (fingerprint, self.key(question))
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def store(self, fingerprint: str, question: str, answer: str):
+        key = (fingerprint, self.key(question))
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def cacheable(answer: str) -> bool:
+        """Only complete answers are kept, not errors or partial results"""
+        return bool(answer) and not answer.startswith(("Error", "⚠️", "Partial result"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(config: CSVAnalysisConfig) -> AnswerCache:
+    """The process-wide answer cache"""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(config.answer_cache_size)
+        return _answer_cache
+
+
+# get_profile calls per dataset fingerprint, shared by all requests on the pool's loop
+_profile_fetches: Dict[str, asyncio.Future] = {}
+
+
 class SchemaCache:
     """Manages file path and schema caching"""
 
@@ -308,6 +702,34 @@ class SchemaCache:
             self.optimizer._cached_file_path = raw_path.strip()
             print(f"File path cached: {self.optimizer._cached_file_path}")
 
+    async def dataset_fingerprint(self, tools: List) -> str:
+        """
+        Identity of the current version of the cached file(s): path, size and
+        mtime from get_file_catalog's stat-based listing. Row counts and the
+        other catalog details are not waited for or used.
+        """
+        catalog_tool = next((t for t in tools if t.name == "get_file_catalog"), None)
+
+        if catalog_tool is None or not self.optimizer._cached_file_path:
+            return ""
+
+        try:
+            raw_catalog = await catalog_tool.ainvoke({})
+        except Exception as e:
+            print(f"⚠️ File catalog unavailable: {e}")
+            return ""
+
+        items = json.loads(raw_catalog) if isinstance(raw_catalog, str) else raw_catalog
+        if isinstance(items, dict):
+            items = [items]
+        entries = [json.loads(obj) if isinstance(obj, str) else obj for obj in items]
+        entries = [e for e in entries if e.get("path") and e["path"] in self.optimizer._cached_file_path]
+        if not entries:
+            return ""
+
+        identity = sorted((e["path"], e.get("size"), e.get("mtime")) for e in entries)
+        return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()[:16]
+
     async def cache_schema(self, tools: List):
         """Cache schema from get_schema tool"""
 
@@ -340,22 +762,109 @@ class SchemaCache:
 
             print(f"Schema cached: {list(self.optimizer._cached_schema.keys())}")
 
+    async def cache_profile(self, tools: List, fingerprint: str = "", timeout: float = 2.0):
+        """
+        Cache compact column statistics from get_profile tool. A cold profile
+        of a large file can take long: after `timeout` seconds the turn goes on
+        with schema-only context while the fetch finishes in the background
+        for later turns on the same file version.
+        """
+        get_profile_tool = next((t for t in tools if t.name == "get_profile"), None)
+
+        if get_profile_tool is None or not self.optimizer._cached_file_path:
+            return
+
+        if not self.optimizer._cached_profile:
+            key = fingerprint or self.optimizer._cached_file_path
+            fetch = _profile_fetches.get(key)
+            if fetch is None:
+                fetch = asyncio.ensure_future(get_profile_tool.ainvoke({
+                    "file_location": self.optimizer._cached_file_path
+                }))
+                _profile_fetches[key] = fetch
+                while len(_profile_fetches) > 32:
+                    _profile_fetches.pop(next(iter(_profile_fetches)))
+
+            done, _ = await asyncio.wait({fetch}, timeout=timeout)
+            if not done:
+                print("⏳ Profile still computing — using schema-only context")
+                return
+
+            try:
+                raw_profile = fetch.result()
+            except Exception as e:
+                _profile_fetches.pop(key, None)
+                print(f"⚠️ Profile unavailable: {e}")
+                return
+            if not fingerprint:
+                _profile_fetches.pop(key, None)  # keyed by path only: may be stale next time
+
+            profile = json.loads(raw_profile) if isinstance(raw_profile, str) else raw_profile
+
+            for column in profile.get("columns", []):
+                self.optimizer._cached_profile[column["name"]] = self._summarize_column(column)
+
+            print(f"Profile cached for {len(self.optimizer._cached_profile)} columns")
+
+    @staticmethod
+    def _summarize_column(column: Dict[str, Any]) -> str:
+        """One-line summary of a profiled column for the model context"""
+        parts = [column["dtype"]]
+        if column.get("null_count"):
+            parts.append(f"{column['null_count']} nulls")
+        if column.get("min") is not None:
+            parts.append(f"range {str(column['min'])[:40]}..{str(column['max'])[:40]}")
+        parts.append(f"~{column.get('distinct_approx')} distinct")
+        top = [str(v["value"])[:30] for v in column.get("top_values", [])]
+        if top:
+            parts.append(f"top {', '.join(top)}")
+        return " | ".join(parts)
+
 
 class WorkflowBuilder:
-    """Builds and compiles the agent workflow"""
+    """Builds and compiles the agent workflow, once per (model_id, tool manifest)"""
+
+    max_workflows = 8
 
-    def __init__(self, config: CSVAnalysisConfig, optimizer: AgentOptimizer):
+    def __init__(self, config: CSVAnalysisConfig):
         self.config = config
-        self.optimizer = optimizer
         self.memory = MemorySaver()
+        self._llm = None
+        self._workflows: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
 
     def create_llm(self):
-        """Create ChatGroq LLM instance"""
-        return ChatGroq(
-            model=self.config.model_id,
-            api_key=self.config.api_key,
-            temperature=0,
-        )
+        """ChatGroq LLM instance, kept so its HTTP connection pool stays warm"""
+        if self._llm is None:
+            self._llm = ChatGroq(
+                model=self.config.model_id,
+                api_key=self.config.api_key,
+                temperature=0,
+            )
+        return self._llm
+
+    def get_workflow(self, tools: List, manifest: str):
+        """Compiled workflow for these tools, built on first use"""
+        key = (self.config.model_id, manifest)
+        with self._lock:
+            app = self._workflows.get(key)
+            if app is not None:
+                self._workflows.move_to_end(key)
+                return app
+
+        app = self.build_workflow(self.create_llm(), [routed_tool(t) for t in tools])
+        print(f"🧩 Workflow compiled for {self.config.model_id} / tools {manifest}")
+
+        with self._lock:
+            self._workflows[key] = app
+            while len(self._workflows) > self.max_workflows:
+                self._workflows.popitem(last=False)
+        return app
+
+    @staticmethod
+    def pre_model_hook(state: MessagesState) -> Dict[str, Any]:
+        """Context injection of the optimizer of the request being run"""
+        return current_optimizer.get().create_optimized_pre_model_hook()(state)
 
     def build_workflow(self, llm, tools: List):
         """Build the complete workflow graph"""
@@ -364,7 +873,7 @@ class WorkflowBuilder:
             tools=tools,
             prompt=CSVAnalysisConfig.INSTRUCTIONS,
             checkpointer=self.memory,
-            pre_model_hook=self.optimizer.create_optimized_pre_model_hook()
+            pre_model_hook=self.pre_model_hook
         )
 
         workflow = StateGraph(MessagesState)
@@ -372,7 +881,7 @@ class WorkflowBuilder:
         workflow.add_edge(START, "reason")
         workflow.add_conditional_edges(
             "reason",
-            self.optimizer.create_smart_router(),
+            AgentOptimizer().create_smart_router(),  # the router keeps no per-request state
             {"reason": "reason", END: END}
         )
 
@@ -382,6 +891,19 @@ class WorkflowBuilder:
         )
 
 
+_workflow_builder: Optional[WorkflowBuilder] = None
+_workflow_builder_lock = threading.Lock()
+
+
+def get_workflow_builder(config: CSVAnalysisConfig) -> WorkflowBuilder:
+    """The process-wide workflow builder and its compiled workflow cache"""
+    global _workflow_builder
+    with _workflow_builder_lock:
+        if _workflow_builder is None:
+            _workflow_builder = WorkflowBuilder(config)
+        return _workflow_builder
+
+
 class AgentExecutor:
     """Executes the agent workflow with STREAMING support"""
 
@@ -391,6 +913,18 @@ class AgentExecutor:
 
     async def execute(self, message: str, thread_id: str = "1"):
         """Execute the agent workflow fully and return last message"""
+        response = "⚠️ No output returned."
+        async for event in self.stream(message, thread_id):
+            if event["type"] in ("final", "error"):
+                response = event["content"]
+        return response
+
+    async def stream(self, message: str, thread_id: str = "1"):
+        """
+        Run the agent workflow and yield events as they happen: `token` for
+        each piece of model output, `tool_start` / `tool_end` around tool calls,
+        then one `final` (the last message) or `error`
+        """
         config = {"configurable": {"thread_id": thread_id}}
         messages = [HumanMessage(content=message)]
 
@@ -398,25 +932,38 @@ class AgentExecutor:
         init_state = MessagesState(messages=messages)
 
         try:
-            print("\n🚀 Starting full invoke...\n")
-            result = await self.app.ainvoke(init_state, config=config)
+            print("\n🚀 Starting streamed run...\n")
+            async for event in self.app.astream_events(init_state, config=config, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if isinstance(content, str) and content:
+                        yield {"type": "token", "content": content}
+                elif kind == "on_tool_start":
+                    yield {"type": "tool_start", "name": event["name"]}
+                elif kind == "on_tool_end":
+                    yield {"type": "tool_end", "name": event["name"]}
+
             elapsed_run = time.perf_counter() - start_time_run
             print(f"\n✅ Agent completed in {elapsed_run:.2f} seconds")
 
             # Return last message text
+            state = await self.app.aget_state(config)
+            result = state.values
             if "messages" in result and len(result["messages"]) > 0:
                 last_msg = result["messages"][-1]
                 if hasattr(last_msg, "content"):
-                    return last_msg.content
+                    yield {"type": "final", "content": last_msg.content}
+                    return
 
-            return "⚠️ No output returned."
+            yield {"type": "final", "content": "⚠️ No output returned."}
 
         except GraphRecursionError:
             print("⚠️ Recursion limit hit — returning partial result.")
-            return "Partial result due to recursion limit."
+            yield {"type": "final", "content": "Partial result due to recursion limit."}
         except Exception as e:
-            print(f"❌ AgentExecutor.execute failed: {e}")
-            return f"Error: {str(e)}"
+            print(f"❌ AgentExecutor.stream failed: {e}")
+            yield {"type": "error", "content": f"Error: {str(e)}"}
 
 
 class CSVAnalysisAgent:
@@ -427,68 +974,108 @@ class CSVAnalysisAgent:
         self.auth_manager = AuthenticationManager(self.config)
         self.optimizer = AgentOptimizer(user_id)
         self.schema_cache = SchemaCache(self.optimizer)
-        self.workflow_builder = WorkflowBuilder(self.config, self.optimizer)
+        self.workflow_builder = get_workflow_builder(self.config)
+        self.answer_cache = get_answer_cache(self.config)
 
     async def run(self, message: str):
-        """Main execution method with STREAMING - yields chunks"""
+        """Main execution method - returns the final answer"""
+        response = "⚠️ No output returned."
+        async for event in self.run_stream(message):
+            if event["type"] in ("final", "error"):
+                response = event["content"]
+        return response
+
+    async def run_stream(self, message: str):
+        """Main execution method with STREAMING - yields events (see AgentExecutor.stream)"""
         start_time = time.time()
 
         try:
-            bearer_token = self.auth_manager.get_bearer_token()
+            async with get_session_pool().session() as conn:
+                try:
+                    tools_by_server = conn.tools
 
-            headers = {
-                "authorization": f"Bearer {bearer_token}",
-                "Content-Type": "application/json"
-            }
+                    await self.schema_cache.cache_file_path(tools_by_server)
 
-            print("🔗 Attempting streaming connection to MCP server...")
+                    fingerprint = await self.schema_cache.dataset_fingerprint(tools_by_server)
+                    if fingerprint:
+                        cached = self.answer_cache.lookup(fingerprint, message)
+                        if cached is not None:
+                            print(f"⚡ Answer served from cache in {time.time() - start_time:.3f} seconds")
+                            yield {"type": "final", "content": cached, "cached": True}
+                            return
 
-            async with streamablehttp_client(self.config.mcp_url, headers, timeout=120) as (r, w, _):
-                async with ClientSession(r, w) as session:
-                    try:
-                        await session.initialize()
-                        tools_by_server = await load_mcp_tools(session)
+                    await self.schema_cache.cache_schema(tools_by_server)
+                    await self.schema_cache.cache_profile(tools_by_server, fingerprint, self.config.profile_timeout)
 
-                        print("------------------------------------------------")
-                        print("✅ MCP CONNECTION AND HANDSHAKE SUCCESSFUL (JWT)! ✅")
+                    app = self.workflow_builder.get_workflow(tools_by_server, conn.manifest)
 
-                        print("Discovering tools...")
-                        for tool in tools_by_server:
-                            name = getattr(tool, "name", "<unknown>")
-                            desc = (getattr(tool, "description", "") or "").strip()
-                            print(f"- {name} :: {desc}")
+                    executor = AgentExecutor(app, recursion_limit=3)
 
-                        await self.schema_cache.cache_file_path(tools_by_server)
-                        await self.schema_cache.cache_schema(tools_by_server)
+                    # the cached workflow reaches this request's session and context through these
+                    current_tools.set({t.name: t for t in tools_by_server})
+                    current_optimizer.set(self.optimizer)
 
-                        llm = self.workflow_builder.create_llm()
-                        app = self.workflow_builder.build_workflow(llm, tools_by_server)
+                    # stream the response; a fresh thread so requests never share checkpoints
+                    thread_id = uuid.uuid4().hex
+                    try:
+                        async for event in executor.stream(message, thread_id=thread_id):
+                            if event["type"] == "final" and fingerprint and self.answer_cache.cacheable(event["content"]):
+                                self.answer_cache.store(fingerprint, message, event["content"])
+                            yield event
+                    finally:
+                        self.workflow_builder.memory.delete_thread(thread_id)
 
-                        executor = AgentExecutor(app, recursion_limit=3)
+                    elapsed_total = time.time() - start_time
+                    print(f"⏱ Total execution time: {elapsed_total:.2f} seconds")
 
-                        # get the response
-                        response = await executor.execute(message)
+                except Exception as e:
+                    print(f"❌ Error during session workflow: {e}")
+                    yield {"type": "error", "content": f"Error during workflow: {str(e)}"}
 
-                        elapsed_total = time.time() - start_time
-                        print(f"⏱ Total execution time: {elapsed_total:.2f} seconds")
-                        return response
+        except Exception as e:
+            print(f"❌ Failed to connect or initialize MCP client: {e}")
+            yield {"type": "error", "content": f"Connection/Initialization error: {str(e)}"}
 
-                    except Exception as e:
-                        print(f"❌ Error during session workflow: {e}")
-                        return f"Error during workflow: {str(e)}"
 
+def stream_agent_events(question: str) -> Generator[Dict[str, Any], None, None]:
+    """
+    Sync generator over the events of one agent run. The run itself happens on
+    the session pool's loop; events are handed over through a queue as they come.
+    """
+    events: queue.Queue = queue.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for event in CSVAnalysisAgent().run_stream(question):
+                events.put(event)
         except Exception as e:
-            print(f"❌ Failed to connect or initialize MCP client: {e}")
-            return f"Connection/Initialization error: {str(e)}"
+            print(f"❌ Agent run failed: {e}")
+            events.put({"type": "error", "content": f"Error: {str(e)}"})
+        finally:
+            events.put(done)
+
+    future = get_session_pool().submit(produce())
+    try:
+        while True:
+            event = events.get()
+            if event is done:
+                break
+            yield event
+        print("✅ Agent run completed successfully!")
+    finally:
+        future.cancel()  # the client went away: stop the run
 
 
 # ============================================
-# SIMPLE TEST WITHOUT BEDROCK
+# ENTRYPOINT
 @app.entrypoint
 def agent_invocation(payload, context):
     """
-    Bedrock Agent simple entrypoint (non-streaming)
-    For testing and debugging WITHOUT streaming logic.
+    Bedrock Agent entrypoint. Streams events over SSE: `token` pieces of the
+    answer as the model writes them, `tool_start` / `tool_end` progress and a
+    `final` event with the complete answer. Send `"stream": false` in the
+    payload to get just the final answer in one response.
     """
     print("🔔 Received payload:", payload)
 
@@ -496,16 +1083,19 @@ def agent_invocation(payload, context):
     if not question:
         return "⚠️ No prompt provided in payload."
 
+    if payload.get("stream", True):
+        return stream_agent_events(question)
+
     # Create your agent
     agent = CSVAnalysisAgent()
 
-    # Run async -> sync bridge (no queue needed)
+    # Run async -> sync bridge on the session pool's loop, so pooled sessions are reused
     async def async_invoke():
         return await agent.run(question)
 
     # Just run once
     try:
-        result = asyncio.run(async_invoke())
+        result = get_session_pool().run(async_invoke())
         print("✅ Agent run completed successfully!")
         return result
     except Exception as e:
@@ -513,9 +1103,9 @@ def agent_invocation(payload, context):
         return f"Error: {str(e)}"
 
 
-
-
 if __name__ == "__main__":
+    # first token is fetched while the runtime starts, not by the first request
+    get_session_pool().auth_manager.broker.prefetch()
     app.run()
 
 
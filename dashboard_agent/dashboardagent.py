@@ -3,8 +3,9 @@ import os
 import time
 import json
 import logging
+import threading
 from textwrap import dedent
-from typing import Dict, Any, List, TypedDict, Annotated
+from typing import Dict, Any, List, Optional, TypedDict, Annotated
 from dataclasses import dataclass
 from mcp.client.streamable_http import streamablehttp_client
 import requests
@@ -204,33 +205,115 @@ Return ONLY the complete HTML document with NO markdown formatting, NO code fenc
         encoded_arn = self.agent_arn.replace(':', '%3A').replace('/', '%2F')
         return f"https://bedrock-agentcore.{self.region}.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
 
-class AuthenticationManager:
-    """Handles OAuth2 authentication"""
-
-    def __init__(self, config: DashboardConfig):
-        self.config = config
-
-    def get_bearer_token(self) -> str:
-        """Gets a fresh access token using the Client Credentials Flow"""
-        print("🔑 Getting fresh Bearer Token...")
+class TokenBroker:
+    """
+    Process-wide OAuth2 client-credentials token cache. The discovery document
+    is fetched once; a token is kept for its real `expires_in` and refreshed in
+    the background before it expires. Concurrent callers share one refresh.
+    """
 
-        response = requests.get(self.config.discovery_url, timeout=10)
-        response.raise_for_status()
-        token_endpoint = response.json().get('token_endpoint')
+    refresh_fraction = 0.8  # refresh once this share of the token lifetime has passed
+    retry_seconds = 30
+
+    def __init__(self, discovery_url: str, client_id: str, client_secret: str):
+        self.discovery_url = discovery_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token_endpoint: Optional[str] = None
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def get_token(self) -> str:
+        """A valid token; only blocks when none has been fetched yet or it already expired"""
+        token, expires_at = self._token, self._expires_at
+        if token and time.time() < expires_at - 5:
+            return token
+        return self._refresh()
+
+    def prefetch(self):
+        """Fetch the first token in the background so no request waits for it"""
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _refresh(self) -> str:
+        with self._lock:
+            # another caller may have refreshed while this one waited
+            if self._token and time.time() < self._refresh_at:
+                return self._token
+            print("🔑 Getting fresh Bearer Token...")
+            try:
+                token_data = self._fetch_token()
+            except Exception:
+                self._token_endpoint = None  # re-read the discovery document next time
+                raise
+            lifetime = float(token_data.get('expires_in') or 3600)
+            now = time.time()
+            self._token = token_data.get('access_token')
+            self._expires_at = now + lifetime
+            self._refresh_at = now + lifetime * self.refresh_fraction
+            self._schedule(self._refresh_at - now)
+            print("Token retrieved successfully.")
+            return self._token
+
+    def _fetch_token(self) -> Dict[str, Any]:
+        if self._token_endpoint is None:
+            response = requests.get(self.discovery_url, timeout=10)
+            response.raise_for_status()
+            self._token_endpoint = response.json().get('token_endpoint')
 
         data = {
             'grant_type': 'client_credentials',
-            'client_id': self.config.client_id,
-            'client_secret': self.config.client_secret,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
         }
 
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
 
-        response = requests.post(token_endpoint, data=data, headers=headers, timeout=10)
+        response = requests.post(self._token_endpoint, data=data, headers=headers, timeout=10)
         response.raise_for_status()
-        token_data = response.json()
-        print("Token retrieved successfully.")
-        return token_data.get('access_token')
+        return response.json()
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 0), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"⚠️ Background token refresh failed: {e}")
+            with self._lock:
+                self._schedule(self.retry_seconds)
+
+
+_token_brokers: Dict[tuple, TokenBroker] = {}
+_token_brokers_lock = threading.Lock()
+
+
+def get_token_broker(discovery_url: str, client_id: str, client_secret: str) -> TokenBroker:
+    """The broker shared by every agent in this process for one set of client credentials"""
+    key = (discovery_url, client_id, client_secret)
+    with _token_brokers_lock:
+        if key not in _token_brokers:
+            _token_brokers[key] = TokenBroker(discovery_url, client_id, client_secret)
+        return _token_brokers[key]
+
+
+class AuthenticationManager:
+    """Handles OAuth2 authentication"""
+
+    def __init__(self, config: DashboardConfig):
+        self.config = config
+        self.broker = get_token_broker(config.discovery_url, config.client_id, config.client_secret)
+
+    def get_bearer_token(self) -> str:
+        """Access token from the process-wide broker (Client Credentials Flow)"""
+        return self.broker.get_token()
 
 class FileCache:
     """Manages file path and schema caching"""
@@ -325,10 +408,14 @@ class SQLExecutor:
 
     def __init__(self, tools: List):
         self.exec_tool = next(t for t in tools if t.name == "execute_polars_sql")
+        self.batch_tool = next((t for t in tools if t.name == "execute_polars_sql_batch"), None)
         logger.info(f"SQL Executor initialized with tool: {self.exec_tool.name}")
 
     async def execute_metrics(self, metrics: List[Dict], csv_path: str) -> List[Dict]:
         """Execute SQL queries for all metrics"""
+        if self.batch_tool is not None and metrics:
+            return await self.execute_metrics_batch(metrics, csv_path)
+
         results = []
 
         for metric in metrics:
@@ -344,11 +431,65 @@ class SQLExecutor:
                 "metric": metric["metric"],
                 "description": metric["description"],
                 "visualization_type": metric["visualization_type"],
-                "data": data or []
+                "data": self._rows(data)
+            })
+
+        return results
+
+    async def execute_metrics_batch(self, metrics: List[Dict], csv_path: str) -> List[Dict]:
+        """Execute all metric queries in one call over a single shared scan"""
+        logger.info(f"Executing {len(metrics)} queries in one batch")
+
+        data = await self.batch_tool.ainvoke({
+            "file_locations": [csv_path],
+            "queries": [{"name": str(i), "query": metric["sql"]} for i, metric in enumerate(metrics)],
+            "file_type": "csv"
+        })
+
+        entries = {entry["name"]: entry for entry in self._batch_entries(data)}
+
+        results = []
+        for i, metric in enumerate(metrics):
+            entry = entries.get(str(i), {})
+            if "error" in entry:
+                logger.error(f"Query for {metric['metric']} failed: {entry['error']}")
+            results.append({
+                "metric": metric["metric"],
+                "description": metric["description"],
+                "visualization_type": metric["visualization_type"],
+                "data": self._rows(entry.get("result"))
             })
 
         return results
 
+    @staticmethod
+    def _batch_entries(data) -> List[Dict]:
+        """
+        Entries of an execute_polars_sql_batch response: one JSON string per
+        entry (a single string when the batch has one query), or decoded dicts
+        """
+        if isinstance(data, (str, dict)):
+            data = [data]
+        entries = []
+        for item in data:
+            item = json.loads(item) if isinstance(item, str) else item
+            entries.extend(item if isinstance(item, list) else [item])
+        return entries
+
+    @staticmethod
+    def _rows(data) -> List[Dict]:
+        """Unwrap the paged result envelope returned by execute_polars_sql"""
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError:
+                return data
+        if isinstance(data, dict):
+            if data.get("truncated"):
+                logger.info(f"Result truncated at {data.get('row_count')} rows")
+            return data.get("rows", [])
+        return data or []
+
 
 class HTMLRenderer:
     """Renders dashboard HTML from data"""
@@ -576,4 +717,6 @@ def agent_invocation(payload, context):
 
 
 if __name__ == "__main__":
+    # first token is fetched while the runtime starts, not by the first request
+    AuthenticationManager(DashboardConfig()).broker.prefetch()
     app.run()
\ No newline at end of file
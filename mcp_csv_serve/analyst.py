@@ -1,13 +1,194 @@
 import argparse
-from typing import List, Dict, Any
+import asyncio
+import bisect
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import json
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pydantic import Field
 from mcp.server.fastmcp import FastMCP
 from glob import glob
 import polars as pl
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+import threading
 import sys
 import os
 
 file_location = os.getenv("FILE_LOCATION", "data/*.csv")
+frame_cache_max_bytes = int(os.getenv("FRAME_CACHE_MAX_BYTES", str(1024 ** 3)))
+lazy_sql_threshold_bytes = int(os.getenv("LAZY_SQL_THRESHOLD_BYTES", str(256 * 1024 ** 2)))
+streaming_threshold_bytes = int(os.getenv("STREAMING_THRESHOLD_BYTES", str(2 * 1024 ** 3)))
+# same default as pl.read_csv's infer_schema_length, so sampled and full reads agree
+schema_sample_rows = int(os.getenv("SCHEMA_SAMPLE_ROWS", "100"))
+state_dir = os.getenv("ANALYST_STATE_DIR", os.path.join(tempfile.gettempdir(), "analyst_state"))
+sidecar_format = os.getenv("SIDECAR_FORMAT", "parquet")  # parquet | ipc | none
+max_result_rows = int(os.getenv("MAX_RESULT_ROWS", "1000"))
+result_cache_ttl_seconds = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+result_cache_max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 ** 2)))
+query_workers = int(os.getenv("QUERY_WORKERS", str(max(2, (os.cpu_count() or 4) // 2))))
+schema_workers = int(os.getenv("SCHEMA_WORKERS", "4"))
+worker_queue_depth = int(os.getenv("WORKER_QUEUE_DEPTH", "16"))
+query_memory_budget_bytes = int(os.getenv("QUERY_MEMORY_BUDGET_BYTES", str(4 * 1024 ** 3)))
+admission_timeout_seconds = float(os.getenv("ADMISSION_TIMEOUT_SECONDS", "30"))
+catalog_poll_seconds = float(os.getenv("CATALOG_POLL_SECONDS", "10"))
+approx_sample_rate = float(os.getenv("APPROX_SAMPLE_RATE", "0.01"))
+# per-request deadlines; queries stop just before the csv_agent client's 120s timeout
+query_timeout_seconds = float(os.getenv("QUERY_TIMEOUT_SECONDS", "110"))
+schema_timeout_seconds = float(os.getenv("SCHEMA_TIMEOUT_SECONDS", "30"))
+# JSON list of {"name", "file_location", "dimensions", "measures", "file_type"} registered at startup
+rollups = json.loads(os.getenv("ROLLUPS", "[]"))
+workload_log_enabled = os.getenv("WORKLOAD_LOG", "1") != "0"
+workload_log_max_rows = int(os.getenv("WORKLOAD_LOG_MAX_ROWS", "100000"))
+workload_log_max_age_days = float(os.getenv("WORKLOAD_LOG_MAX_AGE_DAYS", "30"))
+# estimated cost above which execute_polars_sql applies QUERY_COST_ACTION; 0 disables the guardrail
+query_cost_budget_bytes = int(os.getenv("QUERY_COST_BUDGET_BYTES", str(query_memory_budget_bytes)))
+query_cost_action = os.getenv("QUERY_COST_ACTION", "stream")  # reject | sample | stream
+# compact dtypes for cached frames: categoricals, narrow numbers, parsed dates
+dtype_optimizer_enabled = os.getenv("DTYPE_OPTIMIZER", "0") == "1"
+
+
+
+class Metrics:
+    """
+    Prometheus-style counters and histograms, rendered in the text
+    exposition format by the /metrics route. Gauges of the caches, worker
+    lanes and process memory are read at scrape time.
+    """
+
+    seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    rows_buckets = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+    bytes_buckets = tuple(2 ** p for p in range(20, 37, 2))  # 1 MiB .. 64 GiB
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List] = {}
+        self._buckets: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple = seconds_buckets, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._buckets.setdefault(name, buckets)
+            state = self._histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            index = bisect.bisect_left(self._buckets[name], value)
+            if index < len(buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _escape(value: Any) -> str:
+        """Label value escaped per the text exposition format"""
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def _labels(cls, labels: Tuple, extra: str = "") -> str:
+        parts = [f'{k}="{cls._escape(v)}"' for k, v in labels] + ([extra] if extra else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self, gauges: Dict[str, float]) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._histograms.items())
+            buckets = dict(self._buckets)
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(buckets[name], counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        for name, value in sorted(gauges.items()):
+            metric = name.partition("{")[0]
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} {'counter' if metric.endswith('_total') else 'gauge'}")
+                typed.add(metric)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def current_rss() -> int:
+    """Resident set size of the server process in bytes"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource  # not Linux: peak RSS, in KiB
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+metrics = Metrics()
+
+def metered(fn):
+    """Count calls and record the latency of a tool, labelled by tool name and outcome"""
+    def finish(started: float, status: str) -> None:
+        metrics.inc("analyst_requests_total", tool=fn.__name__, status=status)
+        metrics.observe("analyst_request_seconds", time.perf_counter() - started, tool=fn.__name__)
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started, status = time.perf_counter(), "error"
+            try:
+                result = await fn(*args, **kwargs)
+                status = "ok"
+                return result
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            finally:
+                finish(started, status)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started, status = time.perf_counter(), "error"
+            try:
+                result = fn(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                finish(started, status)
+    return wrapper
+
 
 mcp = FastMCP("analyst", host="0.0.0.0", port=8050, dependencies=["polars"])
 
@@ -19,34 +200,2040 @@ mcp = FastMCP("analyst", host="0.0.0.0", port=8050, dependencies=["polars"])
         "items": {"type": "string"}
     }
 )
+@metered
 def get_files_list() -> List[str]:
-    return glob(file_location)
+    return file_catalog.paths()
 
-def read_file(file_location: str, file_type: str = "csv") -> pl.DataFrame:
+FileFingerprint = Tuple[str, int, int, str]
+# one physical path, or the part files of a sidecar
+FileSource = Union[str, List[str]]
+
+
+def file_fingerprint(file_location: str, file_type: str = "csv") -> FileFingerprint:
+    """
+    Identity of a file's current contents: (path, size, mtime, file_type).
+    Any rewrite of the file changes size or mtime and therefore the key.
+    """
+    stat = os.stat(file_location)
+    return (os.path.abspath(file_location), stat.st_size, stat.st_mtime_ns, file_type)
+
+
+class FrameCache:
+    """
+    In-process LRU cache of parsed DataFrames keyed by file fingerprint.
+    Bounded by an estimated memory budget in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames: "OrderedDict[FileFingerprint, pl.DataFrame]" = OrderedDict()
+        self._sizes: Dict[FileFingerprint, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: FileFingerprint) -> Optional[pl.DataFrame]:
+        with self._lock:
+            df = self._frames.get(key)
+            if df is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return df
+
+    def contains(self, key: FileFingerprint) -> bool:
+        """Membership test that does not touch LRU order or counters"""
+        with self._lock:
+            return key in self._frames
+
+    def peek(self, key: FileFingerprint) -> Optional[pl.DataFrame]:
+        """Lookup that does not touch LRU order or counters"""
+        with self._lock:
+            return self._frames.get(key)
+
+    def latest(self, path: str, file_type: str) -> Optional[Tuple[FileFingerprint, pl.DataFrame]]:
+        """The cached version of a file, whichever fingerprint it has"""
+        with self._lock:
+            for key, df in self._frames.items():
+                if key[0] == path and key[3] == file_type:
+                    return key, df
+        return None
+
+    def put(self, key: FileFingerprint, df: pl.DataFrame) -> None:
+        size = df.estimated_size()
+        if size > self.max_bytes:
+            return  # would evict everything and still not fit
+        with self._lock:
+            # older versions of the same file can never be hit again
+            for stale in [k for k in self._frames if k[0] == key[0] and k[3] == key[3]]:
+                self._remove(stale)
+            self._frames[key] = df
+            self._sizes[key] = size
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._frames))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: FileFingerprint) -> None:
+        del self._frames[key]
+        self.current_bytes -= self._sizes.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._frames),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SchemaCache:
+    """Per-file schema cache keyed by file fingerprint"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._schemas: "OrderedDict[FileFingerprint, pl.Schema]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: FileFingerprint) -> Optional[pl.Schema]:
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is None:
+                self.misses += 1
+                return None
+            self._schemas.move_to_end(key)
+            self.hits += 1
+            return schema
+
+    def put(self, key: FileFingerprint, schema: pl.Schema) -> None:
+        with self._lock:
+            for stale in [k for k in self._schemas if k[0] == key[0] and k[3] == key[3]]:
+                del self._schemas[stale]
+            self._schemas[key] = schema
+            while len(self._schemas) > self.max_entries:
+                self._schemas.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._schemas), "hits": self.hits, "misses": self.misses}
+
+
+class AppendTracker:
+    """
+    Signatures of the CSV versions the server has read, used to recognise
+    append-only growth: the whole old content is unchanged (a streamed hash
+    of the prefix, so an edit anywhere before the old end is caught) and the
+    old end was a line boundary. The appended tail can then be parsed on its
+    own instead of re-reading the whole file. Verifying costs one sequential
+    read of the prefix, far less than parsing it.
+    """
+
+    block = 1024 * 1024
+    versions_per_file = 4
+
+    def __init__(self):
+        self.appends = 0
+        self._signatures: "OrderedDict[FileFingerprint, str]" = OrderedDict()
+        # (old, new) version pairs already verified as clean appends
+        self._verified: "OrderedDict[Tuple[FileFingerprint, FileFingerprint], bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prefix_digest(self, f, size: int):
+        """Hash of the first `size` bytes of an open file, or None if they do not end a row"""
+        digest = hashlib.blake2b(digest_size=16)
+        remaining = size
+        last = b""
+        while remaining > 0:
+            chunk = f.read(min(self.block, remaining))
+            if not chunk:
+                return None  # shorter than recorded: truncated
+            digest.update(chunk)
+            remaining -= len(chunk)
+            last = chunk
+        if size and not last.endswith(b"\n"):
+            return None  # not on a row boundary; growth from here cannot be trusted
+        return digest
+
+    def _signature(self, path: str, size: int) -> Optional[str]:
+        with open(path, "rb") as f:
+            digest = self._prefix_digest(f, size)
+        return digest.hexdigest() if digest is not None else None
+
+    def observe(self, fp: FileFingerprint) -> None:
+        """Record the signature of a CSV version that has just been read"""
+        if fp[3] != "csv":
+            return
+        try:
+            signature = self._signature(fp[0], fp[1])
+        except OSError:
+            return
+        if signature is not None:
+            self._record(fp, signature)
+
+    def _record(self, fp: FileFingerprint, signature: str) -> None:
+        with self._lock:
+            self._signatures[fp] = signature
+            versions = [k for k in self._signatures if k[0] == fp[0]]
+            for old in versions[: -self.versions_per_file]:
+                del self._signatures[old]
+            while len(self._signatures) > 1024:
+                self._signatures.popitem(last=False)
+
+    def read_tail(self, old_fp: FileFingerprint, new_fp: FileFingerprint, schema: pl.Schema) -> Optional[pl.DataFrame]:
+        """
+        Rows appended between two versions of a CSV, parsed with the schema of
+        the old version, or None when the change was not a clean append.
+        """
+        if old_fp[3] != "csv" or old_fp[0] != new_fp[0] or new_fp[1] <= old_fp[1]:
+            return None
+        with self._lock:
+            recorded = self._signatures.get(old_fp)
+            verified = (old_fp, new_fp) in self._verified
+        if recorded is None:
+            return None
+        try:
+            with open(old_fp[0], "rb") as f:
+                header = f.readline()
+                if verified:
+                    # another reader (frame cache, sidecar, aggregates, catalog) already checked this change
+                    digest = None
+                    f.seek(old_fp[1])
+                else:
+                    f.seek(0)
+                    digest = self._prefix_digest(f, old_fp[1])
+                    if digest is None or digest.hexdigest() != recorded:
+                        return None
+                tail = f.read(new_fp[1] - old_fp[1])
+            if not tail.endswith(b"\n"):
+                return None  # a row is still being written
+            df = pl.read_csv(io.BytesIO(header + tail), schema=schema)
+        except Exception:
+            return None
+        if digest is not None:
+            # the new version's signature extends the verified prefix hash, no second read
+            digest.update(tail)
+            self._record(new_fp, digest.hexdigest())
+            with self._lock:
+                self._verified[(old_fp, new_fp)] = True
+                while len(self._verified) > 256:
+                    self._verified.popitem(last=False)
+        with self._lock:
+            self.appends += 1
+        return df
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tracked_versions": len(self._signatures), "appends": self.appends}
+
+
+class SidecarStore:
+    """
+    Columnar (Parquet / Arrow IPC) copies of CSV sources, transcoded in the
+    background on first touch. A sidecar is only served while the source
+    fingerprint recorded in its manifest still matches the CSV on disk.
+    When a CSV only grew, the new rows are written as an extra part file
+    instead of transcoding the whole source again. A source can be given a
+    sort order, so the row-group statistics of its sidecar prune filtered scans.
+    """
+
+    max_parts = 16
+
+    def __init__(self, directory: str, fmt: str):
+        if fmt not in ("parquet", "ipc", "none"):
+            raise ValueError(f"Unsupported sidecar format: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.builds = 0
+        self.appends = 0
+        self.failures = 0
+        self._ready: Dict[str, Tuple[FileFingerprint, List[str]]] = {}
+        self._failed: Dict[str, FileFingerprint] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sidecar")
+        self._sort_orders: Dict[str, List[str]] = {}
+        try:
+            with open(os.path.join(directory, "sort_orders.json"), "r", encoding="utf-8") as f:
+                self._sort_orders = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def enabled(self) -> bool:
+        return self.fmt != "none"
+
+    def _base(self, source: str) -> str:
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.directory, f"{stem}-{digest}")
+
+    def _part_path(self, source: str, part: int) -> str:
+        ext = "parquet" if self.fmt == "parquet" else "arrow"
+        suffix = "" if part == 0 else f".part{part}"
+        return f"{self._base(source)}{suffix}.{ext}"
+
+    def sort_order(self, source: str) -> List[str]:
+        with self._lock:
+            return list(self._sort_orders.get(os.path.abspath(source), []))
+
+    def set_sort_order(self, source: str, columns: List[str]) -> None:
+        """Sort the sidecar of a CSV by these columns; it is rebuilt on next touch"""
+        source = os.path.abspath(source)
+        with self._lock:
+            self._sort_orders[source] = list(columns)
+            self._ready.pop(source, None)
+            self._failed.pop(source, None)
+            sort_orders = dict(self._sort_orders)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "sort_orders.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(sort_orders, f)
+        os.replace(f"{path}.tmp", path)
+
+    def lookup(self, key: FileFingerprint) -> Optional[List[str]]:
+        """
+        Part files of a fresh sidecar for a CSV fingerprint, or None. A missing
+        or stale sidecar is scheduled for (re)building and the caller reads the CSV.
+        """
+        if not self.enabled or key[3] != "csv":
+            return None
+        source = key[0]
+        with self._lock:
+            ready = self._ready.get(source)
+            if ready is None:
+                ready = self._load_manifest(source)
+            if ready is not None and ready[0] == key and all(os.path.exists(p) for p in ready[1]):
+                return ready[1]
+            if self._failed.get(source) == key:
+                return None  # this version of the file cannot be transcoded
+            pending = self._pending.get(source)
+            if pending is None or pending.done():
+                self._pending[source] = self._pool.submit(self._update, key)
+        return None
+
+    def _load_manifest(self, source: str) -> Optional[Tuple[FileFingerprint, List[str]]]:
+        try:
+            with open(f"{self._base(source)}.json", "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("sort_by", []) != self._sort_orders.get(source, []):
+            return None  # built for another sort order
+        parts = [os.path.join(self.directory, p) for p in manifest.get("parts", [])] or [self._part_path(source, 0)]
+        ready = (tuple(manifest["source"]), parts)
+        self._ready[source] = ready
+        return ready
+
+    def _write_manifest(self, source: str, key: FileFingerprint, parts: List[str], sort_by: List[str]) -> None:
+        manifest_path = f"{self._base(source)}.json"
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "source": list(key),
+                "format": self.fmt,
+                "parts": [os.path.basename(p) for p in parts],
+                "sort_by": sort_by,
+            }, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        with self._lock:
+            if self._sort_orders.get(source, []) == sort_by:  # else re-sorted meanwhile; rebuilt on next touch
+                self._ready[source] = (key, parts)
+
+    def _write(self, frame, path: str) -> None:
+        if self.fmt == "parquet":
+            frame.sink_parquet(path) if isinstance(frame, pl.LazyFrame) else frame.write_parquet(path)
+        else:
+            frame.sink_ipc(path) if isinstance(frame, pl.LazyFrame) else frame.write_ipc(path)
+
+    def _update(self, key: FileFingerprint) -> None:
+        source = key[0]
+        with self._lock:
+            ready = self._ready.get(source)
+        if ready is not None and len(ready[1]) < self.max_parts and self._append(ready, key):
+            return
+        self._build(key)
+
+    def _append(self, ready: Tuple[FileFingerprint, List[str]], key: FileFingerprint) -> bool:
+        """Write only the rows appended since the sidecar's version as a new part"""
+        source = key[0]
+        try:
+            schema = scan_file(ready[1], self.fmt).collect_schema()
+        except Exception:
+            return False
+        tail = append_tracker.read_tail(ready[0], key, schema)
+        if tail is None:
+            return False
+        sort_by = self.sort_order(source)
+        if sort_by:
+            tail = tail.sort(sort_by)
+        part_path = self._part_path(source, len(ready[1]))
+        self._write(tail, f"{part_path}.tmp")
+        os.replace(f"{part_path}.tmp", part_path)
+        self._write_manifest(source, key, ready[1] + [part_path], sort_by)
+        with self._lock:
+            self.appends += 1
+        return True
+
+    def _build(self, key: FileFingerprint) -> None:
+        source = key[0]
+        data_path = self._part_path(source, 0)
+        tmp_path = f"{data_path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            sort_by = self.sort_order(source)
+            self._write(pl.scan_csv(source).sort(sort_by) if sort_by else pl.scan_csv(source), tmp_path)
+            if file_fingerprint(source, "csv") != key:
+                os.remove(tmp_path)  # source changed mid-build; the next touch retries
+                return
+            append_tracker.observe(key)
+            os.replace(tmp_path, data_path)
+            with self._lock:
+                previous = self._ready.get(source)
+            self._write_manifest(source, key, [data_path], sort_by)
+            for stale in (previous[1][1:] if previous else []):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            with self._lock:
+                self.builds += 1
+        except Exception as e:
+            with self._lock:
+                self._failed[source] = key
+                self.failures += 1
+            print(f"[server] sidecar build failed for {source}: {e}", file=sys.stderr, flush=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "format": self.fmt,
+                "ready": len(self._ready),
+                "builds": self.builds,
+                "appends": self.appends,
+                "failures": self.failures,
+                "pending": sum(1 for f in self._pending.values() if not f.done()),
+            }
+
+
+class ResultCache:
+    """
+    Encoded query results keyed by normalized query text, input file
+    fingerprints, their dtype plans and paging arguments. Entries expire after a TTL and are
+    evicted LRU under a byte budget; results computed from an older version
+    of any input file are dropped as soon as a newer version is seen.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Tuple, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple, fingerprints: Tuple[FileFingerprint, ...], result: Dict[str, Any], size: int) -> None:
+        if self.ttl_seconds <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            current = {fp[0]: fp for fp in fingerprints}
+            for other in list(self._entries):
+                if any(fp[0] in current and fp != current[fp[0]] for fp in other[1]):
+                    self._remove(other)
+                    self.invalidations += 1
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size, time.monotonic() + self.ttl_seconds)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def file_type_for(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return "parquet"
+    if ext in (".arrow", ".ipc", ".feather"):
+        return "ipc"
+    return "csv"
+
+
+class FileCatalog:
+    """
+    Metadata for the files matched by FILE_LOCATION. Listing and fingerprints
+    come from a cheap glob-and-stat refresh (on demand and by a polling
+    thread), so they are current from the first call. Per-file details (row
+    count, delimiter, encoding, content hash, schema) are described on a
+    background thread when a listed file is new or changed, so callers never
+    wait for the row-count scan; a file that only grew keeps its details and
+    adds the rows of its appended tail. A version that fails to be described
+    is not retried until the file changes.
+    """
+
+    sniff_bytes = 64 * 1024
+    hash_bytes = 1024 * 1024
+    detail_keys = ("content_hash", "encoding", "delimiter", "columns", "row_count", "error")
+
+    def __init__(self, pattern: str, poll_seconds: float):
+        self.pattern = pattern
+        self.poll_seconds = poll_seconds
+        self.refreshes = 0
+        self.describes = 0
+        self.failures = 0
+        self._paths: List[str] = []
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._last_refresh = float("-inf")
+        self._lock = threading.Lock()
+        self._describing: set = set()
+        self._failed: Dict[str, FileFingerprint] = {}
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._poll, name="file-catalog", daemon=True)
+            self._thread.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[server] catalog refresh failed: {e}", file=sys.stderr, flush=True)
+
+    def refresh(self) -> None:
+        """
+        Re-glob and stat the files. Details of unchanged files are kept; a
+        changed file keeps its previous version's details under `previous`
+        until it is described again.
+        """
+        paths = glob(self.pattern)
+        with self._lock:
+            previous = dict(self._entries)
+        entries = {}
+        for path in paths:
+            try:
+                fp = file_fingerprint(path, file_type_for(path))
+            except OSError:
+                continue  # removed between glob and stat
+            entry = previous.get(fp[0])
+            if entry is None or tuple(entry["fingerprint"]) != fp:
+                described = entry if entry is not None and "row_count" in entry else (entry or {}).get("previous")
+                entry = {"path": path, "fingerprint": fp, "size": fp[1], "mtime": fp[2] / 1e9, "file_type": fp[3]}
+                if described is not None:
+                    entry["previous"] = described
+                # listing is the agents' first touch; start transcoding right away
+                sidecar_store.lookup(fp)
+            entries[fp[0]] = entry
+        with self._lock:
+            self._paths = paths
+            self._entries = entries
+            self._last_refresh = time.monotonic()
+            self.refreshes += 1
+
+    def schedule(self, paths: List[str]) -> None:
+        """Describe, in the background, those of the paths whose current version has no details yet"""
+        with self._lock:
+            scheduled = [
+                p for p in paths
+                if p in self._entries and "row_count" not in self._entries[p] and p not in self._describing
+                and self._failed.get(p) != tuple(self._entries[p]["fingerprint"])
+            ]
+            self._describing.update(scheduled)
+        for path in scheduled:
+            self._pool.submit(self.describe, path)
+
+    def describe(self, path: str) -> None:
+        """Fill in the details of the current version of a file; runs on the catalog thread"""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or "row_count" in entry:
+            with self._lock:
+                self._describing.discard(path)
+            return
+        fp = tuple(entry["fingerprint"])
+        try:
+            details = self._describe_append(entry)
+            if details is None:
+                details = self._describe(path, fp)
+                append_tracker.observe(fp)
+            with self._lock:
+                current = self._entries.get(path)
+                if current is not None and tuple(current["fingerprint"]) == fp:
+                    self._entries[path] = dict(
+                        {k: v for k, v in current.items() if k != "previous"}, **details
+                    )
+                self.describes += 1
+        except Exception as e:
+            with self._lock:
+                self._failed[path] = fp
+                self.failures += 1
+            print(f"[server] catalog details of {path} unavailable: {e}", file=sys.stderr, flush=True)
+        finally:
+            with self._lock:
+                self._describing.discard(path)
+
+    def _describe_append(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # a file that only grew: previous details plus the rows of the new tail
+        previous = entry.get("previous")
+        if previous is None or previous.get("row_count") is None or not previous.get("columns"):
+            return None
+        old_fp, fp = tuple(previous["fingerprint"]), tuple(entry["fingerprint"])
+        tail = append_tracker.read_tail(old_fp, fp, infer_schema(entry["path"], fp[3]))
+        if tail is None:
+            return None
+        details = {k: previous[k] for k in self.detail_keys if k in previous}
+        details["content_hash"] = self._content_hash(entry["path"], fp)
+        details["row_count"] = previous["row_count"] + tail.height
+        return details
+
+    def _content_hash(self, path: str, fp: FileFingerprint) -> str:
+        # sampled hash: size plus the first and last MiB of the file
+        digest = hashlib.blake2b(str(fp[1]).encode("ascii"), digest_size=16)
+        with open(path, "rb") as f:
+            digest.update(f.read(self.hash_bytes))
+            if fp[1] > 2 * self.hash_bytes:
+                f.seek(-self.hash_bytes, os.SEEK_END)
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def _describe(self, path: str, fp: FileFingerprint) -> Dict[str, Any]:
+        details: Dict[str, Any] = {"content_hash": self._content_hash(path, fp)}
+        if fp[3] == "csv":
+            with open(path, "rb") as f:
+                sample = f.read(self.sniff_bytes)
+            details["encoding"] = self._detect_encoding(sample)
+            try:
+                text = sample.decode("utf-8", errors="ignore")
+                details["delimiter"] = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+            except csv.Error:
+                details["delimiter"] = ","
+        try:
+            schema = infer_schema(path, fp[3])
+            details["columns"] = [{"name": col, "dtype": str(dtype)} for col, dtype in schema.items()]
+            details["row_count"] = collect_cancellable(scan_file(*resolve_file(fp)).select(pl.len())).item()
+        except QueryInterruptedError:
+            raise
+        except Exception as e:
+            details["columns"] = []
+            details["row_count"] = None
+            details["error"] = str(e)
+        return details
+
+    @staticmethod
+    def _detect_encoding(sample: bytes) -> str:
+        if sample.startswith(b"\xef\xbb\xbf"):
+            return "utf-8-sig"
+        if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+            return "utf-16"
+        try:
+            sample.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if e.start < len(sample) - 3:  # not just a character cut at the sample edge
+                return "unknown (not utf-8)"
+        return "utf-8"
+
+    def _ensure_fresh(self) -> None:
+        # stat-only, so cheap enough to run whenever the last refresh is stale
+        if time.monotonic() - self._last_refresh > self.poll_seconds:
+            self.refresh()
+
+    def paths(self) -> List[str]:
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._paths)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Current listing; files without details yet have row_count None and
+        details "pending" (or "failed" when this version could not be described)
+        """
+        # always re-stat: fingerprints must follow file changes at once
+        self.refresh()
+        entries = []
+        with self._lock:
+            for path, entry in self._entries.items():
+                entry = {k: v for k, v in entry.items() if k not in ("fingerprint", "previous")}
+                if "row_count" not in entry:
+                    failed = self._failed.get(path) == tuple(self._entries[path]["fingerprint"])
+                    entry.update(row_count=None, details="failed" if failed else "pending")
+                entries.append(entry)
+        return entries
+
+    def row_count(self, fp: FileFingerprint) -> Optional[int]:
+        """Catalogued row count of this version of a file, if known"""
+        with self._lock:
+            entry = self._entries.get(fp[0])
+        if entry is None or tuple(entry["fingerprint"]) != fp:
+            return None
+        return entry.get("row_count")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "refreshes": self.refreshes,
+                "describes": self.describes,
+                "failures": self.failures,
+                "describing": len(self._describing),
+                "polling": self._thread is not None,
+            }
+
+
+class ProfileStore:
+    """
+    Column profiles persisted as JSON per file fingerprint, so a profile is
+    computed once per version of a file and survives restarts.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._profiles: Dict[Tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key: Tuple) -> str:
+        # one file per (path, options); the fingerprint inside tells if it is current
+        digest = hashlib.sha1(repr((key[0][0],) + key[1:]).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                try:
+                    with open(self._path(key), "r", encoding="utf-8") as f:
+                        stored = json.load(f)
+                except (OSError, ValueError):
+                    stored = {}
+                if tuple(stored.get("fingerprint", ())) != key[0]:
+                    self.misses += 1
+                    return None
+                profile = stored["profile"]
+                self._profiles[key] = profile
+            self.hits += 1
+            return profile
+
+    def put(self, key: Tuple, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles = {k: v for k, v in self._profiles.items() if k[0][0] != key[0][0] or k[1:] != key[1:]}
+            self._profiles[key] = profile
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": list(key[0]), "profile": profile}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._profiles), "hits": self.hits, "misses": self.misses}
+
+
+class DtypePlanStore:
+    """
+    Compact dtypes for parsed frames, chosen once per file and persisted as
+    JSON per path: low-cardinality strings become Categorical, ISO date-like
+    strings Date / Datetime, and integers and floats the narrowest width
+    holding every value. Later versions of a file reuse the stored plan while
+    its casts stay lossless, otherwise a new plan is chosen.
+    """
+
+    # a string column is categorical when it has at most this many distinct values per row
+    categorical_max_ratio = 0.5
+    temporal_formats = {"Date": "%Y-%m-%d", "Datetime": "%Y-%m-%d %H:%M:%S"}
+    integer_widths = ((pl.Int8, 2 ** 7), (pl.Int16, 2 ** 15), (pl.Int32, 2 ** 31))
+    dtypes = {"Categorical": pl.Categorical, "Float32": pl.Float32, "Int8": pl.Int8, "Int16": pl.Int16, "Int32": pl.Int32}
+
+    def __init__(self, directory: str, enabled: bool):
+        self.directory = directory
+        self.enabled = enabled
+        self.planned = 0
+        self.reused = 0
+        self.bytes_saved = 0
+        self._plans: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, source: str) -> str:
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def plan(self, source: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            plan = self._plans.get(source)
+        if plan is None:
+            try:
+                with open(self._path(source), "r", encoding="utf-8") as f:
+                    plan = json.load(f)["dtypes"]
+            except (OSError, ValueError, KeyError):
+                return None
+            with self._lock:
+                self._plans[source] = plan
+        return plan
+
+    def _save(self, source: str, plan: Dict[str, str]) -> None:
+        with self._lock:
+            self._plans[source] = plan
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(source)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"source": source, "dtypes": plan}, f)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def choose(cls, df: pl.DataFrame) -> Dict[str, str]:
+        """Narrowest lossless dtype per column, for the columns that can shrink"""
+        plan = {}
+        for name, dtype in df.schema.items():
+            values = df.get_column(name).drop_nulls()
+            if values.len() == 0:
+                continue
+            if dtype == pl.String:
+                if values.head(100).str.contains(r"^\d{4}-\d{2}-\d{2}").all():
+                    for kind, fmt in cls.temporal_formats.items():
+                        parsed = values.str.strptime(getattr(pl, kind), fmt, strict=False)
+                        if parsed.null_count() == 0 and (parsed.dt.to_string(fmt) == values).all():
+                            plan[name] = kind
+                            break
+                if name not in plan and values.n_unique() <= df.height * cls.categorical_max_ratio:
+                    plan[name] = "Categorical"
+            elif dtype in (pl.Int64, pl.Int32, pl.Int16):
+                low, high = values.min(), values.max()
+                for target, bound in cls.integer_widths:
+                    if target == dtype:
+                        break
+                    if -bound <= low and high < bound:
+                        plan[name] = str(target)
+                        break
+            elif dtype == pl.Float64:
+                if (values.cast(pl.Float32).cast(pl.Float64) == values).all():
+                    plan[name] = "Float32"
+        return plan
+
+    @classmethod
+    def cast(cls, df: pl.DataFrame, plan: Dict[str, str]) -> pl.DataFrame:
+        """Apply a plan; raises when a value does not fit its planned dtype"""
+        exprs = []
+        for name, kind in plan.items():
+            if kind in cls.temporal_formats:
+                exprs.append(pl.col(name).str.strptime(getattr(pl, kind), cls.temporal_formats[kind], strict=True))
+            else:
+                exprs.append(pl.col(name).cast(cls.dtypes[kind], strict=True))
+        return df.with_columns(exprs)
+
+    def apply(self, source: str, df: pl.DataFrame) -> pl.DataFrame:
+        """The frame with the stored plan of its source applied, choosing one when needed"""
+        if not self.enabled:
+            return df
+        plan = self.plan(source)
+        optimized = None
+        if plan is not None and all(df.schema.get(c) in (pl.String, pl.Int64, pl.Int32, pl.Int16, pl.Float64) for c in plan):
+            try:
+                optimized = self.cast(df, plan)
+            except pl.exceptions.PolarsError:
+                optimized = None  # the file changed beyond the plan: choose again
+        if optimized is None:
+            plan = self.choose(df)
+            optimized = self.cast(df, plan)
+            self._save(source, plan)
+            with self._lock:
+                self.planned += 1
+        else:
+            with self._lock:
+                self.reused += 1
+        with self._lock:
+            self.bytes_saved += df.estimated_size() - optimized.estimated_size()
+        return optimized
+
+    def version(self, source: str) -> Optional[str]:
+        """Short hash of the file's stored plan, or None; results typed under one plan are not reused under another"""
+        plan = self.plan(source) if self.enabled else None
+        if not plan:
+            return None
+        return hashlib.sha1(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def query_schema(self, source: str, schema: pl.Schema) -> pl.Schema:
+        """
+        The schema queries see for a file with this parsed or optimized
+        schema: numbers at the width source_frame widens them to, and the
+        stored plan's Categorical / Date / Datetime for string columns.
+        """
+        if not self.enabled:
+            return schema
+        plan = self.plan(source) or {}
+        dtypes = {}
+        for name, dtype in schema.items():
+            kind = plan.get(name)
+            if dtype == pl.String and (kind == "Categorical" or kind in self.temporal_formats):
+                dtype = getattr(pl, kind)()
+            if dtype in (pl.Int8, pl.Int16, pl.Int32):
+                dtype = pl.Int64
+            elif dtype == pl.Float32:
+                dtype = pl.Float64
+            dtypes[name] = dtype
+        return pl.Schema(dtypes)
+
+    @classmethod
+    def conform(cls, lf: pl.LazyFrame, schema: pl.Schema) -> pl.LazyFrame:
+        """The frame cast to a query schema; values that do not fit become null"""
+        current = lf.collect_schema()
+        exprs = []
+        for name, dtype in schema.items():
+            if current[name] == dtype:
+                continue
+            fmt = next((f for kind, f in cls.temporal_formats.items() if dtype == getattr(pl, kind)), None)
+            if current[name] == pl.String and fmt is not None:
+                exprs.append(pl.col(name).str.strptime(dtype, fmt, strict=False))
+            else:
+                exprs.append(pl.col(name).cast(dtype, strict=False))
+        return lf.with_columns(exprs) if exprs else lf
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "plans": len(self._plans),
+                "planned": self.planned,
+                "reused": self.reused,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+class SampleStore:
+    """
+    Uniform Bernoulli row samples of a file set at a given rate, kept for
+    approximate queries. Each sampled row is tagged with one of `replicates`
+    random groups so query results can carry error estimates. A sample is
+    rebuilt when any input file changes.
+    """
+
+    def __init__(self, replicates: int = 10, max_entries: int = 4, seed: int = 0):
+        self.replicates = replicates
+        self.max_entries = max_entries
+        self.seed = seed
+        self.builds = 0
+        self._samples: "OrderedDict[Tuple, pl.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, fingerprints: Tuple[FileFingerprint, ...], rate: float) -> bool:
+        with self._lock:
+            return (fingerprints, rate) in self._samples
+
+    def get(self, file_locations: List[str], file_type: str, rate: float) -> pl.DataFrame:
+        key = (tuple(file_fingerprint(f, file_type) for f in file_locations), rate)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is not None:
+                self._samples.move_to_end(key)
+                return sample
+        resolution = 1_000_000
+        row_hash = pl.col("__row").hash(self.seed)
+        plan = (
+            scan_file_list(file_locations, file_type)
+            .with_row_index("__row")
+            .filter(row_hash % resolution < int(rate * resolution))
+            .with_columns((pl.col("__row").hash(self.seed + 1) % self.replicates).alias("__replicate"))
+            .drop("__row")
+        )
+        sample = collect_cancellable(plan, engine="streaming")
+        with self._lock:
+            paths = {fp[0] for fp in key[0]}
+            for stale in [k for k in self._samples if paths & {fp[0] for fp in k[0]}]:
+                del self._samples[stale]
+            self._samples[key] = sample
+            while len(self._samples) > self.max_entries:
+                self._samples.popitem(last=False)
+            self.builds += 1
+        return sample
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._samples),
+                "rows": sum(s.height for s in self._samples.values()),
+                "builds": self.builds,
+            }
+
+
+class AggregateRegistry:
+    """
+    Named group-by aggregates over a single file. Each one keeps mergeable
+    partials (__count, and __sum__/__count__/__min__/__max__ per measure), so
+    when its CSV only grew the appended rows are aggregated and merged in
+    instead of recomputing from the whole file. Definitions are persisted;
+    the aggregates themselves are rebuilt on first use after a restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.full_builds = 0
+        self.incremental_updates = 0
+        self.rewrites = 0
+        self._definitions: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Tuple[FileFingerprint, pl.Schema, pl.DataFrame]] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._definitions = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def register(self, name: str, file_location: str, file_type: str, dimensions: List[str], measures: List[str]) -> None:
+        with self._lock:
+            self._definitions[name] = {
+                "file_location": file_location,
+                "file_type": file_type,
+                "dimensions": list(dimensions),
+                "measures": list(measures),
+            }
+            self._results.pop(name, None)
+            definitions = dict(self._definitions)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(definitions, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def definitions(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: dict(d) for name, d in self._definitions.items()}
+
+    def rows(self, name: str) -> Optional[int]:
+        """Row count of the materialized aggregate, if built"""
+        with self._lock:
+            cached = self._results.get(name)
+        return cached[2].height if cached is not None else None
+
+    def definition(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            if name not in self._definitions:
+                raise ValueError(f"Unknown aggregate: {name}")
+            return dict(self._definitions[name])
+
+    def is_current(self, name: str) -> bool:
+        """Whether the aggregate is materialized for the current version of its file"""
+        definition = self.definition(name)
+        with self._lock:
+            cached = self._results.get(name)
+        return cached is not None and cached[0] == file_fingerprint(definition["file_location"], definition["file_type"])
+
+    def match(self, file_locations: List[str], file_type: str, query: str) -> Optional[Tuple[str, str]]:
+        """
+        (name, rewritten query) of the smallest registered aggregate that can
+        answer a query over a single file, or None
+        """
+        if len(file_locations) != 1:
+            return None
+        path = os.path.abspath(file_locations[0])
+        with self._lock:
+            candidates = sorted(
+                (name for name, d in self._definitions.items()
+                 if os.path.abspath(d["file_location"]) == path and d["file_type"] == file_type),
+                key=lambda name: len(self._definitions[name]["dimensions"]),
+            )
+        for name in candidates:
+            definition = self.definition(name)
+            rewritten = rewrite_for_rollup(query, definition["dimensions"], definition["measures"])
+            if rewritten is not None:
+                return name, rewritten
+        return None
+
+    def record_rewrite(self) -> None:
+        with self._lock:
+            self.rewrites += 1
+
+    def _partials(self, lf: pl.LazyFrame, schema: pl.Schema, definition: Dict[str, Any]) -> pl.LazyFrame:
+        exprs = [pl.len().cast(pl.Int64).alias("__count")]
+        for m in definition["measures"]:
+            if schema[m].is_numeric():
+                exprs.append(pl.col(m).sum().alias(f"__sum__{m}"))
+            exprs += [
+                pl.col(m).count().cast(pl.Int64).alias(f"__count__{m}"),
+                pl.col(m).min().alias(f"__min__{m}"),
+                pl.col(m).max().alias(f"__max__{m}"),
+            ]
+        dims = definition["dimensions"]
+        return lf.group_by(dims, maintain_order=True).agg(exprs) if dims else lf.select(exprs)
+
+    def _merge(self, frames: List[pl.DataFrame], definition: Dict[str, Any]) -> pl.DataFrame:
+        combined = pl.concat(frames, how="vertical_relaxed").lazy()
+        exprs = []
+        for c in combined.collect_schema().names():
+            if c in definition["dimensions"]:
+                continue
+            exprs.append(pl.col(c).min() if c.startswith("__min__") else pl.col(c).max() if c.startswith("__max__") else pl.col(c).sum())
+        dims = definition["dimensions"]
+        merged = combined.group_by(dims, maintain_order=True).agg(exprs) if dims else combined.select(exprs)
+        return merged.collect()
+
+    def get(self, name: str) -> pl.DataFrame:
+        definition = self.definition(name)
+        file_location, file_type = definition["file_location"], definition["file_type"]
+        fp = file_fingerprint(file_location, file_type)
+        with self._lock:
+            cached = self._results.get(name)
+        if cached is not None and cached[0] == fp:
+            return cached[2]
+        if cached is not None:
+            tail = append_tracker.read_tail(cached[0], fp, cached[1])
+            if tail is not None:
+                df = self._merge([cached[2], self._partials(tail.lazy(), cached[1], definition).collect()], definition)
+                with self._lock:
+                    self._results[name] = (fp, cached[1], df)
+                    self.incremental_updates += 1
+                return df
+        lf = scan_file_list([file_location], file_type)
+        schema = lf.collect_schema()
+        missing = [c for c in definition["dimensions"] + definition["measures"] if c not in schema]
+        if missing:
+            raise ValueError(f"Columns not in {file_location}: {missing}")
+        df = collect_cancellable(self._partials(lf, schema, definition), engine="streaming")
+        if file_fingerprint(file_location, file_type) == fp:
+            append_tracker.observe(fp)
+            with self._lock:
+                self._results[name] = (fp, schema, df)
+        with self._lock:
+            self.full_builds += 1
+        return df
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "registered": len(self._definitions),
+                "materialized": len(self._results),
+                "full_builds": self.full_builds,
+                "incremental_updates": self.incremental_updates,
+                "rewrites": self.rewrites,
+            }
+
+
+class WorkloadLog:
+    """
+    Every executed query with its shape, referenced columns, grouping,
+    aggregates, filter predicates, rows scanned, latency and result size, in
+    a local SQLite file. Entries are described and written on a background
+    thread so logging never delays a response. Only the normalized shape is
+    stored, not the query text with its literals, and entries beyond the
+    row or age limit are pruned. Mined by advise_workload.
+    """
+
+    prune_every = 100
+    columns = (
+        "ts", "shape", "file_locations", "file_type", "source", "execution_mode",
+        "columns", "group_by", "aggregates", "filters", "rollup_dimensions", "rollup_measures",
+        "rows_scanned", "latency_ms", "result_rows", "result_bytes",
+    )
+    json_columns = (
+        "file_locations", "columns", "group_by", "aggregates", "filters", "rollup_dimensions", "rollup_measures",
+    )
+
+    def __init__(self, path: str, enabled: bool, max_rows: int = 0, max_age_seconds: float = 0):
+        self.path = path
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self.recorded = 0
+        self.failures = 0
+        self.pruned = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="workload-log")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS queries ("
+                "ts REAL, query TEXT, shape TEXT, file_locations TEXT, file_type TEXT, source TEXT, "
+                "execution_mode TEXT, columns TEXT, group_by TEXT, aggregates TEXT, filters TEXT, "
+                "rollup_dimensions TEXT, rollup_measures TEXT, rows_scanned INTEGER, latency_ms REAL, "
+                "result_rows INTEGER, result_bytes INTEGER)"
+            )
+            # logs written before shapes replaced the query text still hold literals
+            self._connection.execute("UPDATE queries SET query = NULL WHERE query IS NOT NULL")
+            self._prune(self._connection)
+            self._connection.commit()
+        return self._connection
+
+    def _prune(self, connection: sqlite3.Connection) -> None:
+        """Drop entries older than the age limit, then the oldest beyond the row limit"""
+        before = connection.total_changes
+        if self.max_age_seconds > 0:
+            connection.execute("DELETE FROM queries WHERE ts < ?", (time.time() - self.max_age_seconds,))
+        if self.max_rows > 0:
+            connection.execute(
+                "DELETE FROM queries WHERE rowid <= (SELECT rowid FROM queries ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                (self.max_rows,),
+            )
+        self.pruned += connection.total_changes - before
+
+    def record(
+        self,
+        file_locations: List[str],
+        file_type: str,
+        query: str,
+        source: str,
+        execution_mode: Optional[str],
+        latency_ms: float,
+        rows_scanned: Optional[int],
+        result: Optional[Dict[str, Any]],
+        result_bytes: int,
+    ) -> None:
+        if not self.enabled:
+            return
+        entry = {
+            "ts": time.time(),
+            "query": query,
+            "file_locations": list(file_locations),
+            "file_type": file_type,
+            "source": source,
+            "execution_mode": execution_mode,
+            "rows_scanned": rows_scanned,
+            "latency_ms": latency_ms,
+            "result_rows": result["row_count"] if result else None,
+            "result_bytes": result_bytes,
+        }
+        self._pool.submit(self._write, entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        try:
+            schema = infer_schema(entry["file_locations"][0], entry["file_type"])
+            entry.update(describe_query(entry["query"], list(schema.names())))
+            values = [
+                json.dumps(entry.get(c)) if c in self.json_columns else entry.get(c) for c in self.columns
+            ]
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    f"INSERT INTO queries ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(values))})", values
+                )
+                self.recorded += 1
+                if self.recorded % self.prune_every == 0:
+                    self._prune(connection)
+                connection.commit()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            print(f"[server] workload log write failed: {e}", file=sys.stderr, flush=True)
+
+    def flush(self) -> None:
+        """Wait for pending writes"""
+        self._pool.submit(lambda: None).result()
+
+    def entries(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(self.columns)} FROM queries WHERE ts >= ?", (since or 0,)
+            ).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(zip(self.columns, row))
+            for c in self.json_columns:
+                entry[c] = json.loads(entry[c]) if entry[c] is not None else None
+            entries.append(entry)
+        return entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "recorded": self.recorded, "failures": self.failures, "pruned": self.pruned}
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when a request cannot be admitted to a worker lane"""
+
+
+class QueryInterruptedError(RuntimeError):
+    """Raised in a worker when its request was cancelled by the client"""
+
+
+class QueryTimeoutError(QueryInterruptedError, TimeoutError):
+    """Raised in a worker when its request ran past its deadline"""
+
+
+class CancelToken:
+    """
+    Deadline and cancellation flag of one request. The worker running the
+    request polls it while Polars executes in the background and cancels
+    the Polars query as soon as either trips.
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.peak_rss = 0  # highest process RSS seen while the request's plans ran
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise QueryInterruptedError("Request cancelled by the client")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise QueryTimeoutError(f"Query exceeded its {self.timeout:g}s deadline")
+
+    def wait(self, seconds: float) -> None:
+        """Sleep up to `seconds`, waking early on cancellation"""
+        self._cancelled.wait(seconds)
+
+
+# the CancelToken of the request a worker thread is running
+current_request = threading.local()
+
+def check_request() -> None:
+    """Raise if the calling worker's request was cancelled or is past its deadline"""
+    token = getattr(current_request, "token", None)
+    if token is not None:
+        token.check()
+
+def collect_cancellable(plan: pl.LazyFrame, engine: str = "auto") -> pl.DataFrame:
+    """
+    Collect a plan, cancelling it when the current request is cancelled or
+    times out, so abandoned work stops and releases its memory promptly.
+    """
+    token = getattr(current_request, "token", None)
+    if token is None:
+        return plan.collect(engine=engine)
+    query = plan.collect(background=True, engine=engine)
+    interval = 0.001
+    while True:
+        df = query.fetch()
+        if df is not None:
+            return df
+        token.peak_rss = max(token.peak_rss, current_rss())
+        try:
+            token.check()
+        except QueryInterruptedError:
+            query.cancel()
+            raise
+        token.wait(interval)
+        interval = min(interval * 2, 0.05)
+
+
+def collect_all_cancellable(plans: List[pl.LazyFrame], engine: str = "auto") -> List[pl.DataFrame]:
+    """
+    Cancellable pl.collect_all: the plans are packed side by side into one
+    plan, each result imploded into a single struct-list cell, so a shared
+    scan is still cached and computed once while collect_cancellable can
+    stop the whole run.
+    """
+    if not plans:
+        return []
+    packed = pl.concat(
+        [plan.select(pl.struct(pl.all()).implode().alias(str(i))) for i, plan in enumerate(plans)],
+        how="horizontal",
+    )
+    row = collect_cancellable(packed, engine=engine)
+    return [row[str(i)][0].struct.unnest() for i in range(len(plans))]
+
+
+class WorkerLane:
+    """
+    A thread pool with its own concurrency limit, bounded wait queue and
+    per-request deadline
+    """
+
+    def __init__(self, name: str, workers: int, queue_depth: int, timeout: Optional[float] = None):
+        self.name = name
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.timeouts = 0
+        self.cancelled = 0
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+
+
+class WorkerPool:
+    """
+    Runs blocking Polars work off the event loop. Schema lookups and queries
+    use separate lanes so short calls never wait behind long scans; queries
+    also reserve an estimated memory footprint against a shared budget.
+    """
+
+    def __init__(self, lanes: List[WorkerLane], memory_budget: int, admission_timeout: float):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.memory_budget = memory_budget
+        self.admission_timeout = admission_timeout
+        self.reserved_bytes = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _admissible(self, lane: WorkerLane, memory_estimate: int) -> bool:
+        if lane.active >= lane.workers:
+            return False
+        # an estimate above the whole budget still runs, but only on its own
+        return self.reserved_bytes + memory_estimate <= self.memory_budget or self.reserved_bytes == 0
+
+    async def run(self, lane_name: str, memory_estimate: int, fn, *args):
+        """
+        Run fn(*args) on a lane worker under the lane's deadline. If the
+        awaiting task is cancelled (client disconnect), the worker is told to
+        stop; its slot and memory reservation are held until it has stopped.
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        lane = self.lanes[lane_name]
+        token = CancelToken(lane.timeout)
+        async with self._condition:
+            if not self._admissible(lane, memory_estimate):
+                if lane.waiting >= lane.queue_depth:
+                    lane.rejected += 1
+                    raise ServerBusyError(f"Server busy: {lane.waiting} {lane.name} requests already waiting")
+                lane.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._admissible(lane, memory_estimate)),
+                        self.admission_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    lane.rejected += 1
+                    raise ServerBusyError(f"Server busy: no {lane.name} worker within {self.admission_timeout:g}s")
+                finally:
+                    lane.waiting -= 1
+            lane.active += 1
+            self.reserved_bytes += memory_estimate
+        loop = asyncio.get_running_loop()
+        work = lane.executor.submit(self._call, token, fn, *args)
+        outcome = asyncio.wrap_future(work)
+        try:
+            return await asyncio.shield(outcome)
+        except QueryTimeoutError:
+            lane.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            token.cancel()
+            lane.cancelled += 1
+            outcome.add_done_callback(lambda f: f.cancelled() or f.exception())  # nobody awaits it now
+            raise
+        finally:
+            if work.done():
+                await self._release(lane, memory_estimate)
+            else:
+                work.add_done_callback(
+                    lambda _: asyncio.run_coroutine_threadsafe(self._release(lane, memory_estimate), loop)
+                )
+
+    @staticmethod
+    def _call(token: CancelToken, fn, *args):
+        current_request.token = token
+        token.peak_rss = current_rss()
+        started = time.process_time()
+        try:
+            token.check()  # cancelled or expired while queued
+            return fn(*args)
+        finally:
+            current_request.token = None
+            metrics.observe("analyst_worker_cpu_seconds", time.process_time() - started, function=fn.__name__)
+            metrics.observe(
+                "analyst_query_peak_rss_bytes", max(token.peak_rss, current_rss()), Metrics.bytes_buckets,
+                function=fn.__name__,
+            )
+
+    async def _release(self, lane: WorkerLane, memory_estimate: int) -> None:
+        async with self._condition:
+            lane.active -= 1
+            lane.completed += 1
+            self.reserved_bytes -= memory_estimate
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reserved_bytes": self.reserved_bytes,
+            "memory_budget": self.memory_budget,
+            "lanes": {
+                name: {
+                    "workers": lane.workers,
+                    "active": lane.active,
+                    "waiting": lane.waiting,
+                    "queue_depth": lane.queue_depth,
+                    "completed": lane.completed,
+                    "rejected": lane.rejected,
+                    "timeout_seconds": lane.timeout,
+                    "timeouts": lane.timeouts,
+                    "cancelled": lane.cancelled,
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
+
+
+append_tracker = AppendTracker()
+frame_cache = FrameCache(frame_cache_max_bytes)
+schema_cache = SchemaCache()
+result_cache = ResultCache(result_cache_max_bytes, result_cache_ttl_seconds)
+sidecar_store = SidecarStore(os.path.join(state_dir, "sidecars"), sidecar_format)
+file_catalog = FileCatalog(file_location, catalog_poll_seconds)
+profile_store = ProfileStore(os.path.join(state_dir, "profiles"))
+dtype_plans = DtypePlanStore(os.path.join(state_dir, "dtype_plans"), dtype_optimizer_enabled)
+sample_store = SampleStore()
+aggregate_registry = AggregateRegistry(os.path.join(state_dir, "aggregates.json"))
+workload_log = WorkloadLog(
+    os.path.join(state_dir, "workload.sqlite"), workload_log_enabled,
+    workload_log_max_rows, workload_log_max_age_days * 86400,
+)
+for spec in rollups:
+    aggregate_registry.register(
+        spec["name"], spec["file_location"], spec.get("file_type", "csv"),
+        spec.get("dimensions", []), spec.get("measures", []),
+    )
+worker_pool = WorkerPool(
+    [
+        WorkerLane("schema", schema_workers, worker_queue_depth, schema_timeout_seconds),
+        WorkerLane("query", query_workers, worker_queue_depth, query_timeout_seconds),
+    ],
+    query_memory_budget_bytes,
+    admission_timeout_seconds,
+)
+
+
+def parse_file(file_location: FileSource, file_type: str = "csv") -> pl.DataFrame:
+    # a collected scan rather than read_*, so a cancelled request stops parsing
+    return collect_cancellable(scan_file(file_location, file_type))
+
+def scan_file(file_location: FileSource, file_type: str = "csv") -> pl.LazyFrame:
     if file_type == "csv":
-        return pl.read_csv(file_location)
+        return pl.scan_csv(file_location)
     elif file_type == "parquet":
-        return pl.read_parquet(file_location)
+        return pl.scan_parquet(file_location)
+    elif file_type == "ipc":
+        return pl.scan_ipc(file_location)
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
 
-def read_file_list(file_locations: List[str], file_type: str = "csv") -> pl.DataFrame:
+def resolve_file(key: FileFingerprint, file_order: bool = False) -> Tuple[FileSource, str]:
     """
-    Lazy read multiple files for performance
+    Physical (path(s), file_type) to read for a source: its sidecar when
+    fresh. With file_order, a sidecar sorted by a sort order is skipped, so
+    the rows come in the order of the file.
     """
-    if file_type == "csv":
-        dfs = [pl.scan_csv(f) for f in file_locations]  # lazy execution
-        return pl.concat(dfs).collect()  # compute only once
-    elif file_type == "parquet":
-        dfs = pl.read_parquet(file_locations)
-        return dfs
+    if file_order and sidecar_store.sort_order(key[0]):
+        return key[0], key[3]
+    sidecar = sidecar_store.lookup(key)
+    if sidecar is not None:
+        return sidecar, sidecar_store.fmt
+    return key[0], key[3]
+
+def read_file(file_location: str, file_type: str = "csv") -> pl.DataFrame:
+    """
+    Read a file, serving repeated reads of unchanged files from the frame cache
+    """
+    key = file_fingerprint(file_location, file_type)
+    df = frame_cache.get(key)
+    if df is not None:
+        return df
+    previous = frame_cache.latest(key[0], file_type)
+    tail = append_tracker.read_tail(previous[0], key, previous[1].schema) if previous else None
+    if tail is not None:
+        df = pl.concat([previous[1], tail])  # append-only growth: parse just the new rows
     else:
+        with metrics.timer("analyst_phase_seconds", phase="parse"):
+            # cached frames serve every query and sample, so they keep the file's row order
+            df = dtype_plans.apply(key[0], parse_file(*resolve_file(key, file_order=True)))
+        append_tracker.observe(key)
+    frame_cache.put(key, df)
+    return df
+
+def read_file_list(file_locations: List[str], file_type: str = "csv") -> pl.DataFrame:
+    """
+    Read multiple files with the same schema; each file is cached separately
+    """
+    if file_type not in ("csv", "parquet", "ipc"):
         raise ValueError(f"Unsupported file type: {file_type}")
+    dfs = [read_file(f, file_type) for f in file_locations]
+    # relaxed: the dtype optimizer may have picked different widths per file
+    return dfs[0] if len(dfs) == 1 else pl.concat(dfs, how="vertical_relaxed")
+
+def scan_file_list(file_locations: List[str], file_type: str = "csv", file_order: bool = False) -> pl.LazyFrame:
+    """
+    Lazy scan of multiple files; nothing is read until the plan is collected,
+    so projections and filters are pushed down into the scan
+    """
+    scans = [scan_file(*resolve_file(file_fingerprint(f, file_type), file_order)) for f in file_locations]
+    return scans[0] if len(scans) == 1 else pl.concat(scans)
+
+def known_row_count(fingerprints: Tuple[FileFingerprint, ...]) -> Optional[int]:
+    """Total rows of the inputs when already known (cached frame or catalog), without reading them"""
+    total = 0
+    for fp in fingerprints:
+        cached = frame_cache.peek(fp)
+        rows = cached.height if cached is not None else file_catalog.row_count(fp)
+        if rows is None:
+            return None
+        total += rows
+    return total
+
+def infer_schema(file_location: str, file_type: str = "csv") -> pl.Schema:
+    """
+    Schema without a full parse: a bounded row sample for CSV, the footer for
+    Parquet, or the cached frame when the file is already loaded
+    """
+    key = file_fingerprint(file_location, file_type)
+    schema = schema_cache.get(key)
+    if schema is not None:
+        return schema
+    cached = frame_cache.peek(key)
+    path, physical_type = resolve_file(key)
+    if cached is not None:
+        schema = cached.schema
+    elif physical_type == "csv":
+        schema = pl.scan_csv(path, infer_schema_length=schema_sample_rows).collect_schema()
+    else:
+        schema = scan_file(path, physical_type).collect_schema()
+    schema_cache.put(key, schema)
+    return schema
+
+def query_schema(file_location: str, file_type: str = "csv") -> pl.Schema:
+    """Schema with the file's dtype plan applied, as queries see it; reported by get_schema and get_profile"""
+    return dtype_plans.query_schema(file_fingerprint(file_location, file_type)[0], infer_schema(file_location, file_type))
+
+execution_modes = ("auto", "eager", "lazy", "streaming")
+# working set admitted for a streaming query, whatever the input size
+streaming_working_set_bytes = 512 * 1024 ** 2
+
+def resolve_execution_mode(fingerprints: Tuple[FileFingerprint, ...], execution_mode: str = "auto") -> str:
+    """
+    Concrete mode for a request. auto uses cached frames when all inputs are
+    hot or small, a pushdown scan for large inputs and the streaming engine
+    for inputs above STREAMING_THRESHOLD_BYTES.
+    """
+    if execution_mode not in execution_modes:
+        raise ValueError(f"Unsupported execution mode: {execution_mode}")
+    if execution_mode != "auto":
+        return execution_mode
+    total_bytes = sum(fp[1] for fp in fingerprints)
+    if total_bytes <= lazy_sql_threshold_bytes or all(frame_cache.contains(fp) for fp in fingerprints):
+        return "eager"
+    if total_bytes > streaming_threshold_bytes:
+        return "streaming"
+    return "lazy"
+
+def source_frame(
+    file_locations: List[str], file_type: str = "csv", execution_mode: str = "eager", file_order: bool = False,
+) -> pl.LazyFrame:
+    """
+    The `self` table for a resolved mode: eager is a full parse through the
+    frame cache; lazy and streaming scan the files with pushdown, in file
+    order when asked even if the sidecar is sorted.
+    Narrowed numbers of optimized frames are widened back for the query, so
+    sums do not overflow the storage width, and scans are cast to the dtype
+    plan of their file, so every mode sees the dtypes get_schema reports.
+    """
+    if execution_mode == "eager":
+        return read_file_list(file_locations, file_type).lazy().with_columns(
+            pl.col(pl.Int8, pl.Int16, pl.Int32).cast(pl.Int64),
+            pl.col(pl.Float32).cast(pl.Float64),
+        )
+    if not dtype_plans.enabled:
+        return scan_file_list(file_locations, file_type, file_order)
+    scans = []
+    for f in file_locations:
+        scan = scan_file_list([f], file_type, file_order)
+        schema = dtype_plans.query_schema(file_fingerprint(f, file_type)[0], scan.collect_schema())
+        scans.append(DtypePlanStore.conform(scan, schema))
+    return scans[0] if len(scans) == 1 else pl.concat(scans, how="vertical_relaxed")
+
+def is_ordered(query: str) -> bool:
+    """Whether a query has an ORDER BY (outside string literals)"""
+    masked = re.sub(r"'(?:[^']|'')*'", "''", query)
+    return bool(re.search(r"\border\s+by\b", masked, re.IGNORECASE))
+
+def is_aggregation(query: str) -> bool:
+    """Whether a query aggregates (GROUP BY, DISTINCT or an aggregate function), so its output order is not the input's"""
+    masked = re.sub(r"'(?:[^']|'')*'", "''", query)
+    aggregate_call = r"\b(?:" + "|".join(polars_sql_aggregate_functions) + r")\s*\("
+    return bool(re.search(r"\bgroup\s+by\b|\bdistinct\b|" + aggregate_call, masked, re.IGNORECASE))
+
+def depends_on_row_order(query: str) -> bool:
+    """
+    Whether the rows of a query follow the input order: a row-level query
+    without ORDER BY. Its result can be truncated to a page or a LIMIT, and
+    next_offset pages must continue the same order whichever engine runs
+    them, so such queries read the file in its original order.
+    """
+    return not is_ordered(query) and not is_aggregation(query)
+
+def stable_order(frame: Union[pl.LazyFrame, pl.DataFrame], query: str, columns: Optional[List[str]] = None):
+    """
+    An aggregation without ORDER BY comes out in a different order on every
+    run, so paging it with next_offset would repeat or skip rows: sort it by
+    all its output columns (or `columns`). Other queries are returned as is.
+    """
+    if is_ordered(query) or not is_aggregation(query):
+        return frame
+    schema = frame.collect_schema() if isinstance(frame, pl.LazyFrame) else frame.schema
+    by = [c for c in (columns or schema.names()) if not schema[c].is_nested()]
+    return frame.sort(by, nulls_last=True) if by else frame
+
+def restore_dtypes(source: pl.LazyFrame) -> pl.LazyFrame:
+    """Categorical and temporal columns back as strings, as parsed from the CSV"""
+    return source.with_columns(
+        pl.col(pl.Categorical).cast(pl.String),
+        *[pl.col(getattr(pl, kind)).dt.to_string(fmt) for kind, fmt in DtypePlanStore.temporal_formats.items()],
+    )
+
+def plan_sql(source: pl.LazyFrame, query: str) -> pl.LazyFrame:
+    """Register the source as `self` and build the optimized lazy plan for the query"""
+    if dtype_plans.enabled:
+        try:
+            # dtype errors only surface in the kernels: run the query on zero rows
+            pl.SQLContext(frames={"self": source.clear()}).execute(query, eager=True)
+        except pl.exceptions.PolarsError:
+            # string functions (LIKE, UPPER, SUBSTR) on an optimized column
+            source = restore_dtypes(source)
+    ctx = pl.SQLContext(frames={"self": source})
+    return ctx.execute(query, eager=False)
+
+def estimate_query_memory(fingerprints: Tuple[FileFingerprint, ...], execution_mode: str) -> int:
+    """
+    Rough working-set estimate used for admission: nothing for cached frames,
+    the on-disk size for a full parse, a quarter of it for a pushdown scan and
+    a fixed bound for the streaming engine.
+    """
+    cold = [fp for fp in fingerprints if not frame_cache.contains(fp)]
+    cold_bytes = sum(fp[1] for fp in cold)
+    if not cold:
+        return 0
+    if execution_mode == "streaming":
+        return min(cold_bytes // 4, streaming_working_set_bytes)
+    if execution_mode == "lazy":
+        return cold_bytes // 4
+    return cold_bytes
+
+cost_sample_rows = 10_000
+
+def estimate_row_count(fp: FileFingerprint) -> int:
+    """Known row count of a file, or its size divided by the mean row length of its head"""
+    known = known_row_count((fp,))
+    if known is not None:
+        return known
+    if fp[3] != "csv":
+        return scan_file(*resolve_file(fp)).select(pl.len()).collect().item()  # footer metadata
+    with open(fp[0], "rb") as f:
+        head = f.read(64 * 1024)
+    return max(1, fp[1] * max(1, head.count(b"\n")) // max(1, len(head)))
+
+def estimate_distinct(file_locations: List[str], file_type: str, columns: List[str], rows: int) -> int:
+    """
+    Distinct combinations of `columns`, from the first rows: a count that
+    saturates in the sample is taken as is, otherwise it is scaled up
+    to the full row count (near-unique keys).
+    """
+    sample = scan_file_list(file_locations, file_type).select(columns).head(cost_sample_rows).collect()
+    if sample.height == 0:
+        return 1
+    distinct = sample.n_unique()
+    if sample.height < cost_sample_rows or distinct < sample.height // 2:
+        return distinct
+    return max(distinct, rows * distinct // sample.height)
+
+def estimate_query_cost(file_locations: List[str], file_type: str, query: str, budget: int = 0) -> Dict[str, Any]:
+    """
+    Optimized plan of a query and a rough cost model read from it: bytes
+    scanned after projection pushdown, rows processed (the source is read
+    once per reference, e.g. per UNION branch), join output rows (a cross
+    join multiplies, an equi-join divides by the key's distinct count),
+    aggregation groups, and the working set these imply. With a budget, key
+    columns are only sampled for distinct counts when the worst case (a
+    single join key value, unique group keys) could exceed it; otherwise
+    the worst case is reported.
+    """
+    fingerprints = tuple(file_fingerprint(f, file_type) for f in file_locations)
+    schema = infer_schema(file_locations[0], file_type)
+    plan = plan_sql(scan_file_list(file_locations, file_type), query).explain()
+    rows = sum(estimate_row_count(fp) for fp in fingerprints)
+    input_bytes = sum(fp[1] for fp in fingerprints)
+    fractions = [1.0 if a == "*" else int(a) / int(b) for a, b in re.findall(r"PROJECT (\*|\d+)/(\d+) COLUMNS", plan)]
+    scan_bytes = int(input_bytes * (max(fractions) if fractions else 1.0))
+    row_bytes = max(1, input_bytes // max(1, rows))
+    cache_ids = re.findall(r"CACHE\[id: ([^\]]+)\]", plan)
+    references = max([cache_ids.count(i) for i in set(cache_ids)] or [1])
+
+    def key_columns(text: str) -> List[str]:
+        return [c for c in re.findall(r'col\("([^"]+)"\)', text) if c in schema]
+
+    joins = re.findall(r"(\w+) JOIN:\s*LEFT PLAN ON: \[(.*?)\]\n", plan)
+    group_keys = [key_columns(keys) for keys in re.findall(r"\] BY \[(.*?)\]\n", plan)]
+    worst_state = (len(joins) * rows * rows + sum(rows for keys in group_keys if keys)) * row_bytes
+    sample_keys = budget <= 0 or scan_bytes * references + worst_state > budget
+
+    def distinct_keys(columns: List[str], worst: int) -> int:
+        return estimate_distinct(file_locations, file_type, columns, rows) if sample_keys else worst
+
+    reasons = []
+    join_rows = 0
+    for kind, keys in joins:
+        if kind == "CROSS" or not key_columns(keys):
+            join_rows += rows * rows
+            reasons.append(f"{kind.lower()} join of ~{rows} x {rows} rows")
+        else:
+            distinct = distinct_keys(key_columns(keys), 1)
+            join_rows += rows * rows // max(1, distinct)
+            reasons.append(f"join on {key_columns(keys)} (~{distinct} distinct keys) produces ~{rows * rows // max(1, distinct)} rows")
+    groups = 0
+    for keys in group_keys:
+        if keys:
+            distinct = distinct_keys(keys, rows)
+            groups += distinct
+            if sample_keys and distinct > rows // 2:
+                reasons.append(f"GROUP BY {keys} is near-unique (~{distinct} groups)")
+    if references > 1:
+        reasons.append(f"source read {references} times (UNION / self-reference)")
+    state_bytes = (join_rows + groups) * row_bytes
+    return {
+        "plan": plan,
+        "rows": rows,
+        "rows_processed": rows * references + join_rows,
+        "input_bytes": input_bytes,
+        "scan_bytes": scan_bytes,
+        "join_rows": join_rows,
+        "groups": groups,
+        "state_bytes": state_bytes,
+        "estimated_bytes": scan_bytes * references + state_bytes,
+        "reasons": reasons,
+    }
+
+def guardrail_action(cost: Dict[str, Any], query: str) -> Tuple[str, Optional[float]]:
+    """
+    What execute_polars_sql does with a query of this cost: ("run", None),
+    ("stream", None), ("sample", rate) or ("reject", None).
+    """
+    if query_cost_budget_bytes <= 0 or cost["estimated_bytes"] <= query_cost_budget_bytes:
+        return "run", None
+    if query_cost_action == "stream" and cost["state_bytes"] <= query_cost_budget_bytes:
+        return "stream", None  # only the scan is large; batches keep memory bounded
+    if query_cost_action == "sample" and not re.search(r"\b(with|union|join)\b", query, re.IGNORECASE):
+        for rate in (0.1, 0.01, 0.001):
+            if cost["estimated_bytes"] * rate <= query_cost_budget_bytes:
+                return "sample", rate
+    return "reject", None
+
+def guardrail_rejection(cost: Dict[str, Any]) -> str:
+    """Error message for a query the guardrail rejects"""
+    return (
+        f"Query rejected: estimated cost {cost['estimated_bytes']} bytes exceeds the budget of "
+        f"{query_cost_budget_bytes} bytes ({'; '.join(cost['reasons']) or 'large scan'}). "
+        "Narrow the query (fewer columns, filters, coarser GROUP BY, no cross joins), "
+        "or use approximate=true for single-table aggregates."
+    )
+
+def guardrail_summary(cost: Dict[str, Any], action: str, rate: Optional[float]) -> Dict[str, Any]:
+    """The `guardrail` field of a result the guardrail streamed or sampled"""
+    return {
+        "action": action,
+        "sample_rate": rate,
+        "estimated_bytes": cost["estimated_bytes"],
+        "budget_bytes": query_cost_budget_bytes,
+    }
+
+def estimate_query_costs(
+    file_locations: List[str], file_type: str, queries: List[str], budget: int,
+) -> List[Optional[Dict[str, Any]]]:
+    """estimate_query_cost of each batch query; None for a query that cannot be planned (its run reports why)"""
+    costs: List[Optional[Dict[str, Any]]] = []
+    for query in queries:
+        check_request()
+        try:
+            costs.append(estimate_query_cost(file_locations, file_type, query, budget))
+        except QueryInterruptedError:
+            raise
+        except Exception:
+            costs.append(None)
+    return costs
+
+result_formats = ("records", "columnar")
+
+def page_bounds(offset: int, limit: Optional[int]) -> Tuple[int, int]:
+    """Validate paging arguments and clamp the page size to the server cap"""
+    if offset < 0:
+        raise ValueError("offset must be >= 0")
+    if limit is None:
+        return offset, max_result_rows
+    if limit < 1:
+        raise ValueError("limit must be >= 1")
+    return offset, min(limit, max_result_rows)
+
+def collection_engine(execution_mode: str) -> str:
+    return "streaming" if execution_mode == "streaming" else "auto"
+
+def collect_page(plan: pl.LazyFrame, offset: int, limit: int, execution_mode: str = "eager") -> Tuple[pl.DataFrame, bool]:
+    """
+    Collect one page of a plan. The slice is part of the plan, so the engine
+    stops early where it can; one extra row tells whether more pages exist.
+    Streaming mode runs the plan in batches with bounded memory.
+    """
+    with metrics.timer("analyst_phase_seconds", phase="execute"):
+        page = collect_cancellable(plan.slice(offset, limit + 1), engine=collection_engine(execution_mode))
+    return page.head(limit), page.height > limit
+
+def encode_result(page: pl.DataFrame, offset: int, has_more: bool, result_format: str = "records") -> Dict[str, Any]:
+    """
+    Paged result envelope. `records` holds one dict per row; `columnar` lists
+    the column names once and one value array per column.
+    """
+    if result_format not in result_formats:
+        raise ValueError(f"Unsupported result format: {result_format}")
+    started = time.perf_counter()
+    result: Dict[str, Any] = {
+        "columns": page.columns,
+        "row_count": page.height,
+        "offset": offset,
+        "next_offset": offset + page.height if has_more else None,
+        "truncated": has_more,
+    }
+    if result_format == "records":
+        result["rows"] = page.to_dicts()
+    else:
+        result["data"] = [page.get_column(c).to_list() for c in page.columns]
+    metrics.observe("analyst_phase_seconds", time.perf_counter() - started, phase="serialize")
+    return result
+
+def json_value(value: Any) -> Any:
+    """Plain JSON value for a profile statistic (temporal and decimal values as text)"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def compute_profile(file_location: str, file_type: str, top_k: int) -> Dict[str, Any]:
+    """
+    Per-column statistics computed in a single vectorized pass: null count,
+    approximate distinct count, min/max, mean/std for numeric columns and the
+    top-K most frequent values.
+    """
+    fp = file_fingerprint(file_location, file_type)
+    execution_mode = resolve_execution_mode((fp,))
+    source = source_frame([file_location], file_type, execution_mode)
+    schema = source.collect_schema()
+    exprs = [pl.len().alias("__rows")]
+    for i, (name, dtype) in enumerate(schema.items()):
+        col = pl.col(name)
+        exprs += [
+            col.null_count().alias(f"{i}:null_count"),
+            col.approx_n_unique().alias(f"{i}:distinct_approx"),
+            col.value_counts(sort=True, name="__count").head(top_k).implode().alias(f"{i}:top_values"),
+        ]
+        if dtype.is_numeric() or dtype.is_temporal() or dtype == pl.String:
+            exprs += [col.min().alias(f"{i}:min"), col.max().alias(f"{i}:max")]
+        if dtype.is_numeric():
+            exprs += [col.mean().alias(f"{i}:mean"), col.std().alias(f"{i}:std")]
+    row = collect_cancellable(source.select(exprs), engine=collection_engine(execution_mode)).row(0, named=True)
+    columns = []
+    for i, (name, dtype) in enumerate(schema.items()):
+        column = {"name": name, "dtype": str(dtype)}
+        for stat in ("null_count", "distinct_approx", "min", "max", "mean", "std"):
+            if f"{i}:{stat}" in row:
+                column[stat] = json_value(row[f"{i}:{stat}"])
+        column["top_values"] = [
+            {"value": json_value(entry[name]), "count": entry["__count"]} for entry in row[f"{i}:top_values"]
+        ]
+        columns.append(column)
+    return {"path": file_location, "row_count": row["__rows"], "columns": columns}
+
+sample_methods = ("head", "uniform", "stratified")
+
+def sample_frame(
+    file_locations: List[str],
+    file_type: str,
+    n: int,
+    method: str = "head",
+    by: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    Row sample of the files. head stops reading after n rows (n_rows / slice
+    pushdown into the scan). uniform counts rows, draws n row numbers and
+    streams only those rows out. stratified takes up to n / groups random
+    rows from every value of `by`. Cached frames are sampled in memory.
+    """
+    if method not in sample_methods:
+        raise ValueError(f"Unsupported sample method: {method}")
+    if method == "stratified" and not by:
+        raise ValueError("stratified sampling needs a `by` column")
+    fingerprints = [file_fingerprint(f, file_type) for f in file_locations]
+    if all(frame_cache.contains(fp) for fp in fingerprints):
+        df = read_file_list(file_locations, file_type)
+        if method == "head":
+            return df.head(n)
+        if method == "uniform":
+            return df.sample(min(n, df.height), seed=seed)
+        source = df.lazy()
+    else:
+        # in file order: head means the first rows of the file, and seeded samples stay reproducible
+        source = scan_file_list(file_locations, file_type, file_order=True)
+        if method == "head":
+            return source.head(n).collect()
+        if method == "uniform":
+            total = collect_cancellable(source.select(pl.len()), engine="streaming").item()
+            rows = sorted(random.Random(seed).sample(range(total), min(n, total)))
+            return collect_cancellable(
+                source.with_row_index("__row").filter(pl.col("__row").is_in(rows)).drop("__row"),
+                engine="streaming",
+            )
+    groups = collect_cancellable(source.select(pl.col(by).n_unique()), engine="streaming").item()
+    per_group = max(1, n // max(groups, 1))
+    return collect_cancellable(
+        source.filter(pl.int_range(pl.len()).shuffle(seed=seed).over(by) < per_group).head(n)
+    )
 
 @mcp.tool()
-def get_schema(file_location: str, file_type: str = "csv") -> List[Dict[str, Any]]:
-    df = read_file(file_location, file_type)
-    return [{"name": col, "dtype": str(dtype)} for col, dtype in df.schema.items()]
+@metered
+async def get_schema(file_location: str, file_type: str = "csv") -> List[Dict[str, Any]]:
+    schema = await worker_pool.run("schema", 0, query_schema, file_location, file_type)
+    return [{"name": col, "dtype": str(dtype)} for col, dtype in schema.items()]
 
 polars_sql_aggregate_functions = [
     "avg",
@@ -194,6 +2381,46 @@ def gen_polars_sql_functions_str():
     return "\n".join(sql_functions_agg)
 
 
+sql_keywords = {
+    "select", "distinct", "from", "where", "group", "by", "having", "order", "asc", "desc",
+    "nulls", "limit", "offset", "with", "as", "and", "or", "not", "in", "is", "null",
+    "like", "ilike", "between", "case", "when", "then", "else", "end", "union", "all",
+    "join", "inner", "left", "right", "full", "outer", "cross", "on", "using", "over",
+    "partition", "rows", "range", "true", "false", "interval", "filter",
+}
+sql_keywords.update(fn for fns in polars_sql_functions.values() for fn in fns)
+
+sql_quoted_pattern = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+sql_word_pattern = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+
+
+def result_cache_key(query: str, fingerprints: Tuple[FileFingerprint, ...], *options: Any) -> Tuple:
+    """Result cache key: normalized query, inputs, the dtype plans they are read with, and the request options"""
+    plans = tuple(dtype_plans.version(fp[0]) for fp in fingerprints)
+    return (normalize_query(query), fingerprints, plans) + options
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical query text for cache keys: whitespace collapsed and keywords
+    lowercased outside of quoted literals and identifiers, which are kept as-is
+    because column names are case-sensitive.
+    """
+    parts = []
+    for i, part in enumerate(sql_quoted_pattern.split(query.strip().rstrip(";"))):
+        if i % 2:
+            parts.append(part)
+            continue
+        part = re.sub(r"\s+", " ", part)
+        part = re.sub(r"\s*([(),=<>+*/])\s*", r"\1", part)
+        part = sql_word_pattern.sub(
+            lambda m: m.group(0).lower() if m.group(0).lower() in sql_keywords else m.group(0),
+            part,
+        )
+        parts.append(part)
+    return "".join(parts).strip()
+
+
 query_description = f"""
 The polars sql query to be executed.
 polars sql query must use the table name as `self` to refer to the source data.
@@ -203,34 +2430,924 @@ Supported functions are:
 
 
 @mcp.tool()
-def execute_polars_sql(
+@metered
+async def execute_polars_sql(
     file_locations: List[str],
     query: str = Field(
         description=query_description,
     ),
     file_type: str = Field(
-        description="The type of the file to be read. Supported types are csv and parquet",
+        description="The type of the file to be read. Supported types are csv, parquet and ipc",
         default="csv",
     ),
-) -> List[Dict[str, Any]]:
+    execution_mode: str = Field(
+        description="How the source is read: auto, eager (cached in memory), lazy "
+                    "(scan with column and filter pushdown, for large files) or streaming "
+                    "(out-of-core batches with bounded memory, for files larger than RAM)",
+        default="auto",
+    ),
+    limit: Optional[int] = Field(
+        description=f"Maximum rows to return (server cap {max_result_rows})",
+        default=None,
+    ),
+    offset: int = Field(
+        description="Rows to skip; pass the previous response's next_offset to fetch the next page "
+                    "(pages keep a stable row order)",
+        default=0,
+    ),
+    result_format: str = Field(
+        description="records (one object per row) or columnar (column names once, one value array per column)",
+        default="records",
+    ),
+    approximate: bool = Field(
+        description="Answer from a uniform sample of the data instead of all rows. "
+                    "COUNT/SUM columns must be aliased (`COUNT(...) AS name`, `SUM(...) AS name`); they are "
+                    "scaled up and get name__ci_low / name__ci_high 95% confidence bounds. Fast but not exact.",
+        default=False,
+    ),
+    sample_rate: Optional[float] = Field(
+        description=f"Fraction of rows sampled in approximate mode (default {approx_sample_rate})",
+        default=None,
+    ),
+) -> Dict[str, Any]:
     """
     Reads the data from the given file locations. Note that file_locations
     can be a list of multiple files. However, all files must have the same schema
     and the same columns. Executes the given polars sql query and returns the result.
     Note that the polars sql query must use the table name as `self` to refer to the source data.
+    Results are paged: at most `limit` rows are returned and `next_offset` is set
+    when more rows are available. Pages follow the query's ORDER BY; without
+    one, row-level queries keep the file's row order and aggregations are
+    sorted by all output columns, so pages never repeat or skip rows. Queries estimated to exceed the server's cost
+    budget are streamed, sampled or rejected; `guardrail` says which (see explain_query).
+    """
+    offset, limit = page_bounds(offset, limit)
+    fingerprints = tuple(file_fingerprint(f, file_type) for f in file_locations)
+    started = time.perf_counter()
+
+    def record(source: str, mode: Optional[str], rows_scanned: Optional[int], result: Dict[str, Any], size: int) -> None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        workload_log.record(file_locations, file_type, query, source, mode, latency_ms, rows_scanned, result, size)
+        metrics.inc("analyst_queries_total", source=source)
+        metrics.inc("analyst_rows_scanned_total", rows_scanned or 0, source=source)
+        if source == "raw":
+            metrics.inc("analyst_bytes_scanned_total", sum(fp[1] for fp in fingerprints))
+        metrics.observe("analyst_result_rows", result["row_count"], Metrics.rows_buckets, source=source)
+
+    if approximate:
+        rate = approx_sample_rate if sample_rate is None else sample_rate
+        if not 0 < rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        cache_key = result_cache_key(query, fingerprints, offset, limit, result_format, rate)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            record("cache", None, 0, cached, 0)
+            return cached
+        memory_estimate = 0 if sample_store.contains(fingerprints, rate) else estimate_query_memory(fingerprints, "streaming")
+        result, size = await worker_pool.run(
+            "query", memory_estimate, run_approximate_query,
+            file_locations, query, file_type, rate, offset, limit, result_format,
+        )
+        result_cache.put(cache_key, fingerprints, result, size)
+        record("approximate", None, result["approximate"]["sample_rows"], result, size)
+        return result
+    cache_key = result_cache_key(query, fingerprints, offset, limit, result_format)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        record("cache", None, 0, cached, 0)
+        return cached
+    rollup = aggregate_registry.match(file_locations, file_type, query)
+    if rollup is not None:
+        memory_estimate = 0 if aggregate_registry.is_current(rollup[0]) else estimate_query_memory(fingerprints, "streaming")
+        result, size = await worker_pool.run(
+            "query", memory_estimate, run_rollup_query, rollup[0], query, rollup[1], offset, limit, result_format,
+        )
+        if result is not None:
+            result_cache.put(cache_key, fingerprints, result, size)
+            record("rollup", None, aggregate_registry.rows(rollup[0]), result, size)
+            return result
+    execution_mode = resolve_execution_mode(fingerprints, execution_mode)
+    guardrail = None
+    if query_cost_budget_bytes > 0:
+        cost = await worker_pool.run(
+            "schema", 0, estimate_query_cost, file_locations, file_type, query, query_cost_budget_bytes,
+        )
+        action, rate = guardrail_action(cost, query)
+        if action == "reject":
+            raise ValueError(guardrail_rejection(cost))
+        if action != "run":
+            guardrail = guardrail_summary(cost, action, rate)
+        if action == "sample":
+            result, size = await worker_pool.run(
+                "query", estimate_query_memory(fingerprints, "streaming"), run_approximate_query,
+                file_locations, query, file_type, rate, offset, limit, result_format,
+            )
+            result["guardrail"] = guardrail
+            result_cache.put(cache_key, fingerprints, result, size)
+            record("approximate", None, result["approximate"]["sample_rows"], result, size)
+            return result
+        if action == "stream":
+            execution_mode = "streaming"
+    memory_estimate = estimate_query_memory(fingerprints, execution_mode)
+    result, size = await worker_pool.run(
+        "query", memory_estimate, run_query,
+        file_locations, query, file_type, execution_mode, offset, limit, result_format,
+    )
+    if guardrail is not None:
+        result["guardrail"] = guardrail
+    result_cache.put(cache_key, fingerprints, result, size)
+    record("raw", execution_mode, known_row_count(fingerprints), result, size)
+    return result
+
+
+def run_query(
+    file_locations: List[str],
+    query: str,
+    file_type: str,
+    execution_mode: str,
+    offset: int,
+    limit: int,
+    result_format: str,
+) -> Tuple[Dict[str, Any], int]:
+    """Blocking body of execute_polars_sql; runs on a query worker"""
+    source = source_frame(file_locations, file_type, execution_mode, depends_on_row_order(query))
+    page, has_more = collect_page(stable_order(plan_sql(source, query), query), offset, limit, execution_mode)
+    return encode_result(page, offset, has_more, result_format), page.estimated_size()
+
+
+def run_rollup_query(
+    name: str,
+    query: str,
+    rewritten: str,
+    offset: int,
+    limit: int,
+    result_format: str,
+) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    Runs a query rewritten onto a registered aggregate, with the output
+    column names the original query has on the raw file. Returns (None, 0)
+    when the rewrite does not execute, so the caller falls back to the raw file.
+    """
+    definition = aggregate_registry.definition(name)
+    try:
+        schema = infer_schema(definition["file_location"], definition["file_type"])
+        names = plan_sql(pl.LazyFrame(schema=schema), query).collect_schema().names()
+        plan = stable_order(plan_sql(aggregate_registry.get(name).lazy(), rewritten), query)
+        page, has_more = collect_page(plan, offset, limit)
+        page.columns = names
+    except QueryInterruptedError:
+        raise
+    except Exception as e:
+        print(f"[server] rollup {name} not used: {e}", file=sys.stderr, flush=True)
+        return None, 0
+    aggregate_registry.record_rewrite()
+    result = encode_result(page, offset, has_more, result_format)
+    result["rollup"] = name
+    return result, page.estimated_size()
+
+
+rollup_aggregate_pattern = re.compile(
+    r'\b(count|sum|min|max|avg)\s*\(\s*(\*|"(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_]*)\s*\)', re.IGNORECASE
+)
+
+
+def rewrite_for_rollup(query: str, dimensions: List[str], measures: List[str]) -> Optional[str]:
+    """
+    Rewrites a single-table query onto the partial columns of an aggregate:
+    COUNT(*) -> SUM(__count), SUM(m) -> SUM(__sum__m), AVG(m) -> sum / count,
+    and so on, with counts wrapped in COALESCE so an empty filter still
+    counts 0 as it does on the raw file. Only COUNT/SUM/MIN/MAX/AVG of a bare
+    measure column are covered, and every other column the query references
+    must be a dimension; otherwise None.
+    """
+    literals: List[str] = []
+
+    def stash_literal(match: re.Match) -> str:
+        literals.append(match.group(0))
+        return f"__literal{len(literals) - 1}__"
+
+    def quote(name: str) -> str:
+        return '"' + name.replace('"', '""') + '"'
+
+    def unquote(name: str) -> str:
+        return name[1:-1].replace('""', '"') if name.startswith('"') else name
+
+    masked = re.sub(r"'(?:[^']|'')*'", stash_literal, query)
+    if re.search(r"\b(with|union|join|over|distinct)\b|\bselect\s+\*", masked, re.IGNORECASE):
+        return None
+    replacements: List[str] = []
+    uncovered = []
+
+    def replace_aggregate(match: re.Match) -> str:
+        fn, column = match.group(1).lower(), unquote(match.group(2))
+        if column == "*" and fn == "count":
+            replacements.append('COALESCE(SUM("__count"), 0)')
+        elif column != "*" and column in measures:
+            replacements.append({
+                "count": f"COALESCE(SUM({quote('__count__' + column)}), 0)",
+                "sum": f"SUM({quote('__sum__' + column)})",
+                "min": f"MIN({quote('__min__' + column)})",
+                "max": f"MAX({quote('__max__' + column)})",
+                "avg": f"CAST(SUM({quote('__sum__' + column)}) AS DOUBLE) / NULLIF(SUM({quote('__count__' + column)}), 0)",
+            }[fn])
+        else:
+            uncovered.append(column)
+            return match.group(0)
+        return f"__aggregate{len(replacements) - 1}__"
+
+    rewritten, count = rollup_aggregate_pattern.subn(replace_aggregate, masked)
+    if not count or uncovered:
+        return None
+    aggregate_call = r"\b(?:" + "|".join(polars_sql_aggregate_functions) + r")\s*\("
+    if re.search(aggregate_call, rewritten, re.IGNORECASE):
+        return None  # an aggregate the partials cannot answer
+    aliases = {unquote(a) for a in re.findall(r'\bas\s+("(?:[^"]|"")*"|[A-Za-z_]\w*)', rewritten, re.IGNORECASE)}
+    allowed = set(dimensions) | aliases | {"self"}
+    for identifier in re.findall(r'"(?:[^"]|"")*"', rewritten):
+        if unquote(identifier) not in allowed:
+            return None
+    for word in sql_word_pattern.findall(re.sub(r'"(?:[^"]|"")*"', " ", rewritten)):
+        if word.lower() in sql_keywords or re.fullmatch(r"__(?:aggregate|literal)\d+__", word):
+            continue
+        if word not in allowed:
+            return None
+    rewritten = re.sub(r"__aggregate(\d+)__", lambda m: replacements[int(m.group(1))], rewritten)
+    return re.sub(r"__literal(\d+)__", lambda m: literals[int(m.group(1))], rewritten)
+
+
+def describe_query(query: str, columns: List[str]) -> Dict[str, Any]:
+    """
+    Workload-log description of a query over a table with the given columns:
+    its shape (normalized text with literals replaced by ?), the referenced
+    columns, GROUP BY columns, (function, column) aggregates, (column, operator)
+    WHERE predicates, and the rollup dimensions/measures that would answer it.
+    """
+    def unquote(name: str) -> str:
+        return name[1:-1].replace('""', '"') if name.startswith('"') else name
+
+    masked = re.sub(r"'(?:[^']|'')*'", "?", query)
+    shape = re.sub(r"(?<![\w.])\d+(?:\.\d+)?\b", "?", normalize_query(masked))
+    words = {unquote(w) for w in re.findall(r'"(?:[^"]|"")*"|\b[A-Za-z_][A-Za-z0-9_]*\b', masked)}
+    referenced = [c for c in columns if c in words]
+    aggregates = [(fn.lower(), unquote(c)) for fn, c in rollup_aggregate_pattern.findall(masked)]
+    group_match = re.search(
+        r"\bgroup\s+by\b(.*?)(?:\bhaving\b|\border\s+by\b|\blimit\b|$)", masked, re.IGNORECASE | re.DOTALL
+    )
+    group_by = []
+    for item in split_top_level(group_match.group(1).strip().rstrip(";")) if group_match else []:
+        if unquote(item) in columns:
+            group_by.append(unquote(item))
+    filters = []
+    where_match = re.search(
+        r"\bwhere\b(.*?)(?:\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b|$)", masked, re.IGNORECASE | re.DOTALL
+    )
+    if where_match:
+        predicate = re.compile(
+            r'("(?:[^"]|"")*"|\b[A-Za-z_][A-Za-z0-9_]*\b)\s*'
+            r"(=|!=|<>|<=|>=|<|>|not\s+in\b|in\b|not\s+like\b|like\b|ilike\b|between\b|is\b)",
+            re.IGNORECASE,
+        )
+        for column, op in predicate.findall(where_match.group(1)):
+            if unquote(column) in columns:
+                filters.append((unquote(column), re.sub(r"\s+", " ", op.lower())))
+    measures = sorted({c for _, c in aggregates if c != "*"})
+    rollup_dimensions = None
+    for dimensions in ([c for c in referenced if c not in measures], referenced):
+        if rewrite_for_rollup(query, dimensions, measures) is not None:
+            rollup_dimensions = dimensions
+            break
+    return {
+        "shape": shape,
+        "columns": referenced,
+        "group_by": group_by,
+        "aggregates": aggregates,
+        "filters": filters,
+        "rollup_dimensions": rollup_dimensions,
+        "rollup_measures": measures if rollup_dimensions is not None else None,
+    }
+
+
+def advise_workload(apply: bool = False, top_n: int = 10, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Mines the workload log for rollups and sort orders, ranked by the
+    latency of the logged raw-file queries they would speed up. Rollups
+    answer covered GROUP BY queries from pre-aggregated rows. Sort orders
+    apply to the columnar sidecar, whose per-row-group min/max statistics
+    then act as a sparse index for the filtered columns of queries with an
+    ORDER BY or an aggregation; row-level queries without ORDER BY keep
+    reading the file in its own order (see depends_on_row_order). With
+    apply, the recommendations are registered / applied.
+    """
+    entries = [e for e in workload_log.entries(since) if e["source"] in ("raw", "batch")]
+    existing = aggregate_registry.definitions().values()
+    recommendations = []
+
+    # rollups: one candidate per (file, dimension set), covering every query whose dimensions it contains
+    queries_by_file: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for e in entries:
+        if len(e["file_locations"]) == 1 and e["rollup_dimensions"] is not None:
+            file_key = (os.path.abspath(e["file_locations"][0]), e["file_type"])
+            queries_by_file.setdefault(file_key, []).append(e)
+    for (path, file_type), group in queries_by_file.items():
+        for dimensions in {tuple(sorted(e["rollup_dimensions"])) for e in group}:
+            covered = [e for e in group if set(e["rollup_dimensions"]) <= set(dimensions)]
+            measures = sorted({m for e in covered for m in e["rollup_measures"]})
+            if any(
+                os.path.abspath(d["file_location"]) == path and d["file_type"] == file_type
+                and set(dimensions) <= set(d["dimensions"]) and set(measures) <= set(d["measures"])
+                for d in existing
+            ):
+                continue
+            recommendations.append({
+                "kind": "rollup",
+                "file_location": path,
+                "file_type": file_type,
+                "dimensions": list(dimensions),
+                "measures": measures,
+                "queries": len(covered),
+                "shapes": len({e["shape"] for e in covered}),
+                "expected_savings_ms": round(sum(e["latency_ms"] for e in covered), 1),
+            })
+
+    # sort orders: columns filtered by queries that scan the file (lazy/streaming, where pruning applies)
+    filtered: Dict[Tuple[str, str], Dict[str, List[Dict[str, Any]]]] = {}
+    for e in entries:
+        if e["execution_mode"] not in ("lazy", "streaming"):
+            continue
+        for path in e["file_locations"]:
+            for column in {c for c, _ in e["filters"]}:
+                file_key = (os.path.abspath(path), e["file_type"])
+                filtered.setdefault(file_key, {}).setdefault(column, []).append(e)
+    for (path, file_type), by_column in filtered.items():
+        if file_type != "csv" or not sidecar_store.enabled:
+            continue  # sort orders are applied to the CSV's columnar sidecar
+        ranked = sorted(by_column, key=lambda c: -sum(e["latency_ms"] for e in by_column[c]))
+        sort_by = ranked[:2]
+        if sidecar_store.sort_order(path) == sort_by:
+            continue
+        affected = {id(e): e for c in sort_by for e in by_column[c]}.values()
+        operators = sorted({op for e in affected for c, op in e["filters"] if c in sort_by})
+        recommendations.append({
+            "kind": "sort_order",
+            "file_location": path,
+            "file_type": file_type,
+            "sort_by": sort_by,
+            "operators": operators,
+            "queries": len(affected),
+            # row-group pruning only skips part of the scan; half of the latency is a rough expectation
+            "expected_savings_ms": round(sum(e["latency_ms"] for e in affected) / 2, 1),
+            "median_latency_ms": round(statistics.median(e["latency_ms"] for e in affected), 1),
+        })
+
+    recommendations.sort(key=lambda r: -r["expected_savings_ms"])
+    recommendations = recommendations[:top_n]
+    for r in recommendations:
+        r["applied"] = False
+        if not apply:
+            continue
+        if r["kind"] == "rollup":
+            stem = os.path.splitext(os.path.basename(r["file_location"]))[0]
+            name = f"auto_{stem}_by_{'_'.join(r['dimensions']) or 'all'}"
+            aggregate_registry.register(name, r["file_location"], r["file_type"], r["dimensions"], r["measures"])
+            r["name"] = name
+        else:
+            sidecar_store.set_sort_order(r["file_location"], r["sort_by"])
+        r["applied"] = True
+    return recommendations
+
+
+def split_top_level(text: str) -> List[str]:
+    """Split on commas that are not nested inside parentheses"""
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def group_by_columns(query: str, columns: List[str]) -> Optional[List[str]]:
+    """
+    Output columns that hold the GROUP BY keys of a query: plain column
+    names, aliases or ordinals. Empty without GROUP BY; None when a key
+    cannot be matched to an output column.
+    """
+    match = re.search(r"\bgroup\s+by\b(.*?)(?:\bhaving\b|\border\s+by\b|\blimit\b|$)", query, re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return []
+    keys = []
+    for item in split_top_level(match.group(1).strip().rstrip(";")):
+        name = item[1:-1] if item.startswith('"') and item.endswith('"') else item
+        if name.isdigit() and 0 < int(name) <= len(columns):
+            keys.append(columns[int(name) - 1])
+        elif name in columns:
+            keys.append(name)
+        else:
+            return None
+    return keys
+
+
+def scalable_aggregates(query: str) -> List[str]:
+    """
+    Aliases of select items that are a bare, aliased COUNT(...) or SUM(...)
+    (e.g. `SUM(price * qty) AS revenue`): the outputs that grow with the
+    number of rows and can be scaled up from a sample. COUNT(DISTINCT ...)
+    does not scale and is left out. A bare COUNT/SUM without an alias raises
+    ValueError: its Polars output name (`len`, or the first column it reads)
+    cannot be told apart from the group keys, so it could not be scaled.
+    """
+    aliases = []
+    for match in re.finditer(r"(?:\bselect\b|,)\s*((?:count|sum)\s*\()", query, re.IGNORECASE):
+        depth, end = 1, match.end()
+        while end < len(query) and depth:
+            depth += {"(": 1, ")": -1}.get(query[end], 0)
+            end += 1
+        if depth or re.match(r"\s*distinct\b", query[match.end():end], re.IGNORECASE):
+            continue
+        alias = re.match(r'\s+(?:as\s+)?(?!(?:from|over|filter)\b)(?:"([^"]+)"|(\w+))', query[end:], re.IGNORECASE)
+        if alias:
+            aliases.append(alias.group(1) or alias.group(2))
+        elif re.match(r"\s*(?:,|\bfrom\b|$)", query[end:], re.IGNORECASE):
+            item = query[match.start(1):end]
+            raise ValueError(f"approximate mode needs an alias for {item} so it can be scaled (e.g. {item} AS total)")
+    return aliases
+
+
+def run_approximate_query(
+    file_locations: List[str],
+    query: str,
+    file_type: str,
+    rate: float,
+    offset: int,
+    limit: int,
+    result_format: str,
+    z: float = 1.96,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Blocking body of approximate execute_polars_sql. The query runs on the
+    sample and on each of its random replicate groups; scaled COUNT/SUM
+    columns get a normal confidence interval from the spread between
+    replicates (random-groups variance estimate). A group missing from a
+    replicate counts as zero there; bounds are null when the GROUP BY keys
+    cannot be matched to output columns.
     """
-    df = read_file_list(file_locations, file_type)
-    op_df = df.sql(query)
-    output_records = op_df.to_dicts()
-    return output_records
+    if re.search(r"\b(with|union|join)\b", query, re.IGNORECASE):
+        raise ValueError("approximate mode supports a single SELECT over self (no WITH, UNION or JOIN)")
+    aggregates = scalable_aggregates(query)
+    sample = sample_store.get(file_locations, file_type, rate)
+    k = sample_store.replicates
+    base = sample.lazy().drop("__replicate")
+    plans = [plan_sql(base, query)] + [
+        plan_sql(sample.lazy().filter(pl.col("__replicate") == r).drop("__replicate"), query) for r in range(k)
+    ]
+    full, *replicates = collect_all_cancellable(plans)
+    scaled = [c for c in aggregates if c in full.columns]
+    keys = group_by_columns(query, full.columns)
+    estimate = full.with_columns([pl.col(c) / rate for c in scaled])
+    if scaled and keys is None:
+        estimate = estimate.with_columns(
+            *[pl.lit(None, dtype=pl.Float64).alias(f"{c}__ci_{side}") for c in scaled for side in ("low", "high")]
+        )
+    elif scaled:
+        key_expr = (pl.struct(keys).hash() if keys else pl.lit(0, dtype=pl.UInt64)).alias("__key")
+        spread = (
+            pl.concat([r.select(key_expr, *[pl.col(c).cast(pl.Float64) * (k / rate) for c in scaled]) for r in replicates])
+            .group_by("__key")
+            .agg(
+                *[pl.col(c).sum().alias(f"{c}__s1") for c in scaled],
+                *[(pl.col(c) ** 2).sum().alias(f"{c}__s2") for c in scaled],
+            )
+        )
+        estimate = estimate.with_columns(key_expr).join(spread, on="__key", how="left")
+        bounds = []
+        for c in scaled:
+            s1 = pl.col(f"{c}__s1")
+            s2 = pl.col(f"{c}__s2")
+            se = ((s2 - s1 ** 2 / k) / (k * (k - 1))).clip(lower_bound=0).sqrt()
+            bounds += [(pl.col(c) - z * se).alias(f"{c}__ci_low"), (pl.col(c) + z * se).alias(f"{c}__ci_high")]
+        estimate = estimate.with_columns(bounds).select(full.columns + [b.meta.output_name() for b in bounds])
+    page = stable_order(estimate, query, full.columns).slice(offset, limit)
+    result = encode_result(page, offset, estimate.height > offset + limit, result_format)
+    result["approximate"] = {
+        "sample_rate": rate,
+        "sample_rows": sample.height,
+        "confidence": 0.95 if z == 1.96 else None,
+        "scaled_columns": scaled,
+    }
+    return result, page.estimated_size()
+
 
+@mcp.tool()
+@metered
+async def execute_polars_sql_batch(
+    file_locations: List[str],
+    queries: List[Dict[str, str]] = Field(
+        description="Queries to run over the same files, each as {\"name\": ..., \"query\": ...}. "
+                    "Every query uses `self` as the table name, as in execute_polars_sql.",
+    ),
+    file_type: str = Field(
+        description="The type of the file to be read. Supported types are csv, parquet and ipc",
+        default="csv",
+    ),
+    execution_mode: str = Field(
+        description="How the source is read: auto, eager, lazy or streaming (see execute_polars_sql)",
+        default="auto",
+    ),
+    limit: Optional[int] = Field(
+        description=f"Maximum rows to return per query (server cap {max_result_rows})",
+        default=None,
+    ),
+    result_format: str = Field(
+        description="records or columnar (see execute_polars_sql)",
+        default="records",
+    ),
+) -> List[Dict[str, Any]]:
+    """
+    Runs several named polars sql queries over one shared source in a single
+    call. The plans are evaluated together so a common scan is read once.
+    Returns one entry per query, in order, with either `result` (the same
+    envelope as execute_polars_sql) or `error`. As in execute_polars_sql,
+    a query a registered aggregate covers is answered from it, and each
+    other query goes through the cost guardrail.
+    """
+    _, limit = page_bounds(0, limit)
+    names = [q.get("name") or str(i) for i, q in enumerate(queries)]
+    fingerprints = tuple(file_fingerprint(f, file_type) for f in file_locations)
+    cache_keys = [result_cache_key(q["query"], fingerprints, 0, limit, result_format) for q in queries]
+    outputs: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+    pending = []
+    for i, key in enumerate(cache_keys):
+        cached = result_cache.get(key)
+        if cached is not None:
+            outputs[i] = {"name": names[i], "result": cached}
+            workload_log.record(file_locations, file_type, queries[i]["query"], "cache", None, 0.0, 0, cached, 0)
+        else:
+            pending.append(i)
+    # queries a registered aggregate answers skip the shared scan; the rest fall back to it
+    for i in list(pending):
+        rollup = aggregate_registry.match(file_locations, file_type, queries[i]["query"])
+        if rollup is None:
+            continue
+        started = time.perf_counter()
+        memory_estimate = 0 if aggregate_registry.is_current(rollup[0]) else estimate_query_memory(fingerprints, "streaming")
+        result, size = await worker_pool.run(
+            "query", memory_estimate, run_rollup_query, rollup[0], queries[i]["query"], rollup[1], 0, limit, result_format,
+        )
+        if result is None:
+            continue
+        pending.remove(i)
+        result_cache.put(cache_keys[i], fingerprints, result, size)
+        outputs[i] = {"name": names[i], "result": result}
+        rows_scanned = aggregate_registry.rows(rollup[0])
+        workload_log.record(
+            file_locations, file_type, queries[i]["query"], "rollup", None,
+            (time.perf_counter() - started) * 1000, rows_scanned, result, size,
+        )
+        metrics.inc("analyst_queries_total", source="rollup")
+        metrics.inc("analyst_rows_scanned_total", rows_scanned or 0, source="rollup")
+        metrics.observe("analyst_result_rows", result["row_count"], Metrics.rows_buckets, source="rollup")
+    guardrails: Dict[int, Dict[str, Any]] = {}
+    if pending:
+        execution_mode = resolve_execution_mode(fingerprints, execution_mode)
+    if pending and query_cost_budget_bytes > 0:
+        costs = await worker_pool.run(
+            "schema", 0, estimate_query_costs,
+            file_locations, file_type, [queries[i]["query"] for i in pending], query_cost_budget_bytes,
+        )
+        for i, cost in zip(list(pending), costs):
+            if cost is None:
+                continue
+            action, rate = guardrail_action(cost, queries[i]["query"])
+            if action == "run":
+                continue
+            if action == "stream":
+                guardrails[i] = guardrail_summary(cost, action, rate)
+                execution_mode = "streaming"  # the scan is shared, so the whole batch streams
+                continue
+            pending.remove(i)
+            if action == "reject":
+                outputs[i] = {"name": names[i], "error": guardrail_rejection(cost)}
+                continue
+            started = time.perf_counter()
+            try:
+                result, size = await worker_pool.run(
+                    "query", estimate_query_memory(fingerprints, "streaming"), run_approximate_query,
+                    file_locations, queries[i]["query"], file_type, rate, 0, limit, result_format,
+                )
+            except (QueryInterruptedError, ServerBusyError):
+                raise
+            except Exception as e:
+                outputs[i] = {"name": names[i], "error": str(e)}
+                continue
+            result["guardrail"] = guardrail_summary(cost, action, rate)
+            result_cache.put(cache_keys[i], fingerprints, result, size)
+            outputs[i] = {"name": names[i], "result": result}
+            workload_log.record(
+                file_locations, file_type, queries[i]["query"], "approximate", None,
+                (time.perf_counter() - started) * 1000, result["approximate"]["sample_rows"], result, size,
+            )
+            metrics.inc("analyst_queries_total", source="approximate")
+            metrics.observe("analyst_result_rows", result["row_count"], Metrics.rows_buckets, source="approximate")
+    if pending:
+        started = time.perf_counter()
+        memory_estimate = estimate_query_memory(fingerprints, execution_mode)
+        computed = await worker_pool.run(
+            "query", memory_estimate, run_query_batch,
+            file_locations, [queries[i]["query"] for i in pending], file_type, execution_mode, limit, result_format,
+        )
+        # the scan is shared, so each query is logged with an equal share of the batch latency
+        latency_ms = (time.perf_counter() - started) * 1000 / len(pending)
+        rows_scanned = known_row_count(fingerprints)
+        for i, (result, size, error) in zip(pending, computed):
+            if error is not None:
+                outputs[i] = {"name": names[i], "error": error}
+            else:
+                if i in guardrails:
+                    result["guardrail"] = guardrails[i]
+                result_cache.put(cache_keys[i], fingerprints, result, size)
+                outputs[i] = {"name": names[i], "result": result}
+                workload_log.record(
+                    file_locations, file_type, queries[i]["query"], "batch", execution_mode,
+                    latency_ms, rows_scanned, result, size,
+                )
+                metrics.inc("analyst_queries_total", source="batch")
+                metrics.observe("analyst_result_rows", result["row_count"], Metrics.rows_buckets, source="batch")
+        # one shared scan for the whole batch
+        metrics.inc("analyst_rows_scanned_total", rows_scanned or 0, source="batch")
+        metrics.inc("analyst_bytes_scanned_total", sum(fp[1] for fp in fingerprints))
+    return outputs
 
 
+def run_query_batch(
+    file_locations: List[str],
+    queries: List[str],
+    file_type: str,
+    execution_mode: str,
+    limit: int,
+    result_format: str,
+) -> List[Tuple[Optional[Dict[str, Any]], int, Optional[str]]]:
+    """
+    Blocking body of execute_polars_sql_batch. All plans share one source and
+    are collected together (cancellably) so common subplans (the scan) are
+    computed once;
+    if the joint collect fails, plans are collected one by one to pin errors
+    to the query that caused them.
+    """
+    engine = collection_engine(execution_mode)
+    file_order = any(depends_on_row_order(q) for q in queries)
+    source = source_frame(file_locations, file_type, execution_mode, file_order)
+    outputs: List[Tuple[Optional[Dict[str, Any]], int, Optional[str]]] = [(None, 0, None)] * len(queries)
+    plans = {}
+    for i, query in enumerate(queries):
+        try:
+            plans[i] = stable_order(plan_sql(source, query), query).slice(0, limit + 1)
+        except Exception as e:
+            outputs[i] = (None, 0, str(e))
+    try:
+        frames = dict(zip(plans, collect_all_cancellable(list(plans.values()), engine=engine)))
+    except QueryInterruptedError:
+        raise
+    except Exception:
+        frames = {}
+        for i, plan in plans.items():
+            try:
+                frames[i] = collect_cancellable(plan, engine=engine)
+            except QueryInterruptedError:
+                raise
+            except Exception as e:
+                outputs[i] = (None, 0, str(e))
+    for i, df in frames.items():
+        page = df.head(limit)
+        outputs[i] = (encode_result(page, 0, df.height > limit, result_format), page.estimated_size(), None)
+    return outputs
+
+
+@mcp.tool()
+@metered
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss counters and sizes of the server caches: query results,
+    parsed frames, schemas, columnar sidecars and registered aggregates.
+    """
+    return {
+        "result_cache": result_cache.stats(),
+        "frame_cache": frame_cache.stats(),
+        "schema_cache": schema_cache.stats(),
+        "sidecars": sidecar_store.stats(),
+        "appends": append_tracker.stats(),
+        "profiles": profile_store.stats(),
+        "dtype_plans": dtype_plans.stats(),
+        "samples": sample_store.stats(),
+        "aggregates": aggregate_registry.stats(),
+        "catalog": file_catalog.stats(),
+        "workload_log": workload_log.stats(),
+        "workers": worker_pool.stats(),
+    }
+
+
+@mcp.tool()
+@metered
+async def explain_query(
+    file_locations: List[str],
+    query: str = Field(description="The polars sql query to explain, using `self` as the table name"),
+    file_type: str = "csv",
+) -> Dict[str, Any]:
+    """
+    Optimized Polars plan of a query, with estimated rows and bytes scanned,
+    join output rows, aggregation groups and working set. The query itself
+    is not run, but the head of the files is read to count the distinct
+    values of join and GROUP BY keys.
+    `guardrail` tells what execute_polars_sql would do with it: run, stream,
+    sample or reject (when the estimate exceeds the server's cost budget).
+    """
+    cost = await worker_pool.run("schema", 0, estimate_query_cost, file_locations, file_type, query)
+    action, rate = guardrail_action(cost, query)
+    cost["guardrail"] = {"action": action, "sample_rate": rate, "budget_bytes": query_cost_budget_bytes}
+    return cost
+
+
+@mcp.tool()
+@metered
+async def get_profile(
+    file_location: str,
+    file_type: str = "csv",
+    top_k: int = Field(description="Number of most frequent values reported per column", default=5),
+) -> Dict[str, Any]:
+    """
+    Column profile of a file: row_count and, per column, dtype, null_count,
+    distinct_approx, min, max, mean, std (numeric) and top_values.
+    Use it to learn value ranges and category spellings before writing SQL.
+    Profiles are cached per file version, so repeated calls are instant.
+    """
+    fp = file_fingerprint(file_location, file_type)
+    key = (fp, top_k)
+    profile = profile_store.get(key)
+    if profile is None:
+        execution_mode = resolve_execution_mode((fp,))
+        profile = await worker_pool.run(
+            "query", estimate_query_memory((fp,), execution_mode),
+            compute_profile, file_location, file_type, top_k,
+        )
+        profile_store.put(key, profile)
+    return profile
+
+
+@mcp.tool()
+@metered
+async def sample_rows(
+    file_locations: List[str],
+    n: int = Field(description=f"Number of rows to return (server cap {max_result_rows})", default=20),
+    method: str = Field(
+        description="head (first rows, cheapest), uniform (random rows from the whole file) "
+                    "or stratified (random rows from every value of `by`)",
+        default="head",
+    ),
+    by: Optional[str] = Field(description="Column to stratify on (stratified only)", default=None),
+    seed: Optional[int] = Field(description="Random seed for reproducible samples", default=None),
+    file_type: str = "csv",
+    result_format: str = Field(description="records or columnar (see execute_polars_sql)", default="records"),
+) -> Dict[str, Any]:
+    """
+    Returns sample rows of the given files to see what the data looks like.
+    Prefer this over execute_polars_sql for looking at raw rows: head reads
+    only the beginning of the file.
+    """
+    _, n = page_bounds(0, n)
+    fingerprints = tuple(file_fingerprint(f, file_type) for f in file_locations)
+    # the stratified draw shuffles within every group, which holds the whole file in memory
+    sample_mode = {"head": None, "uniform": "streaming"}.get(method, "eager")
+    memory_estimate = estimate_query_memory(fingerprints, sample_mode) if sample_mode else 0
+    page = await worker_pool.run(
+        "query", memory_estimate, sample_frame, file_locations, file_type, n, method, by, seed,
+    )
+    return encode_result(page, 0, False, result_format)
+
+
+@mcp.tool()
+@metered
+def get_file_catalog(
+    name_contains: Optional[str] = Field(
+        description="Only files whose path contains this text (case-insensitive)",
+        default=None,
+    ),
+    required_columns: Optional[List[str]] = Field(
+        description="Only files whose schema has all of these columns",
+        default=None,
+    ),
+) -> List[Dict[str, Any]]:
+    """
+    Describes the available source files: path, size, mtime, file_type,
+    row_count, delimiter, encoding, content_hash and columns (name and dtype).
+    Use it to pick the right file before querying. Details are computed once
+    per version of a file, in the background: until then a file has
+    row_count null and details "pending" (call again later, or use
+    get_schema), or "failed" when they could not be computed.
+    """
+    entries = file_catalog.entries()
+    if name_contains:
+        entries = [e for e in entries if name_contains.lower() in e["path"].lower()]
+    file_catalog.schedule([e["path"] for e in entries])
+    if required_columns:
+        wanted = set(required_columns)
+        entries = [e for e in entries if wanted <= {c["name"] for c in e.get("columns", [])}]
+    return entries
+
+
+@mcp.tool()
+@metered
+def register_aggregate(
+    name: str,
+    file_location: str,
+    dimensions: List[str] = Field(description="Columns to group by; empty for a single total row", default=[]),
+    measures: List[str] = Field(description="Columns to aggregate", default=[]),
+    file_type: str = "csv",
+) -> Dict[str, Any]:
+    """
+    Registers a named aggregate of one file: row count per group plus sum,
+    non-null count, min and max of each measure. Read it with get_aggregate;
+    it is kept up to date as the file changes, cheaply when rows are only appended.
+    """
+    if file_type not in ("csv", "parquet", "ipc"):
+        raise ValueError(f"Unsupported file type: {file_type}")
+    aggregate_registry.register(name, file_location, file_type, dimensions, measures)
+    return {"name": name, **aggregate_registry.definition(name)}
+
+
+@mcp.tool()
+@metered
+async def get_aggregate(
+    name: str,
+    limit: Optional[int] = Field(description=f"Maximum rows to return (server cap {max_result_rows})", default=None),
+    offset: int = Field(description="Rows to skip, for paging through large results", default=0),
+    result_format: str = Field(description="records or columnar (see execute_polars_sql)", default="records"),
+) -> Dict[str, Any]:
+    """
+    Rows of a registered aggregate: the dimension columns, __count and
+    __sum__<m>, __count__<m>, __min__<m>, __max__<m> per measure
+    (mean = __sum__<m> / __count__<m>).
+    """
+    definition = aggregate_registry.definition(name)
+    offset, limit = page_bounds(offset, limit)
+    fp = file_fingerprint(definition["file_location"], definition["file_type"])
+    df = await worker_pool.run("query", estimate_query_memory((fp,), "streaming"), aggregate_registry.get, name)
+    return encode_result(df.slice(offset, limit), offset, df.height > offset + limit, result_format)
+
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    gauges: Dict[str, float] = {"analyst_process_rss_bytes": current_rss()}
+    for name, stats in (
+        ("result", result_cache.stats()), ("frame", frame_cache.stats()), ("schema", schema_cache.stats()),
+        ("profile", profile_store.stats()),
+    ):
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        gauges[f'analyst_cache_hit_ratio{{cache="{name}"}}'] = hits / (hits + misses) if hits + misses else 0.0
+        if "bytes" in stats:
+            gauges[f'analyst_cache_bytes{{cache="{name}"}}'] = stats["bytes"]
+    workers = worker_pool.stats()
+    gauges["analyst_reserved_memory_bytes"] = workers["reserved_bytes"]
+    for lane, stats in workers["lanes"].items():
+        for field in ("active", "waiting"):
+            gauges[f'analyst_lane_{field}{{lane="{lane}"}}'] = stats[field]
+        for field in ("completed", "rejected", "timeouts", "cancelled"):
+            gauges[f'analyst_lane_{field}_total{{lane="{lane}"}}'] = stats[field]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+@mcp.tool()
+@metered
+def get_workload_advice(
+    apply: bool = Field(description="Register the recommended rollups and sort orders", default=False),
+    top_n: int = Field(description="Number of recommendations", default=10),
+) -> List[Dict[str, Any]]:
+    """
+    Recommendations mined from the log of executed queries: rollups
+    (pre-aggregated tables that answer repeated GROUP BY queries) and sidecar
+    sort orders for frequently filtered columns, ranked by expected latency savings.
+    A sort order only serves queries with an ORDER BY or an aggregation; samples
+    and row-level queries without ORDER BY keep the file's order.
+    """
+    return advise_workload(apply=apply, top_n=top_n)
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Polars SQL analyst MCP server")
+    parser.add_argument("--advise", action="store_true", help="print rollup / sort order recommendations from the workload log and exit")
+    parser.add_argument("--apply", action="store_true", help="with --advise, register the recommended rollups and sort orders")
+    parser.add_argument("--top", type=int, default=10, help="with --advise, number of recommendations")
+    args = parser.parse_args()
+    if args.advise:
+        print(json.dumps(advise_workload(apply=args.apply, top_n=args.top), indent=2))
+        return
+
     # prevent protocol corruption by prints
 
     print("[server] starting…", file=sys.stderr, flush=True)
+    file_catalog.start()
     mcp.run(
         transport="streamable-http"
 
@@ -3,9 +3,11 @@ import time
 import datetime
 import json
 import uuid
+import threading
 import boto3
 import requests
 import streamlit as st
+from typing import Any, Dict, Optional
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
@@ -51,8 +53,6 @@ if "logs" not in st.session_state:
     st.session_state.logs = []
 if "file_info" not in st.session_state:
     st.session_state.file_info = {}
-if "token_cache" not in st.session_state:
-    st.session_state.token_cache = {}
 
 # =========================
 # Logging
@@ -63,54 +63,116 @@ def add_log(message: str):
     st.session_state.logs.append(f"[{timestamp}] {message}")
 
 # =========================
-# Token Management (In-Memory Cache)
+# Token Management (shared by all sessions)
 # =========================
-def get_or_refresh_token(task_type: str) -> str:
-    """Get token from session cache or fetch new one"""
+class TokenBroker:
+    """
+    Process-wide OAuth2 client-credentials token cache. The discovery document
+    is fetched once; a token is kept for its real `expires_in` and refreshed in
+    the background before it expires. Concurrent callers share one refresh.
+    """
+
+    refresh_fraction = 0.8  # refresh once this share of the token lifetime has passed
+    retry_seconds = 30
+
+    def __init__(self, discovery_url: str, client_id: str, client_secret: str):
+        self.discovery_url = discovery_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token_endpoint: Optional[str] = None
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def get_token(self) -> str:
+        """A valid token; only blocks when none has been fetched yet or it already expired"""
+        token, expires_at = self._token, self._expires_at
+        if token and time.time() < expires_at - 5:
+            return token
+        return self._refresh()
+
+    def prefetch(self):
+        """Fetch the first token in the background so no request waits for it"""
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _refresh(self) -> str:
+        with self._lock:
+            # another caller may have refreshed while this one waited
+            if self._token and time.time() < self._refresh_at:
+                return self._token
+            print("🔑 Getting fresh Bearer Token...")
+            try:
+                token_data = self._fetch_token()
+            except Exception:
+                self._token_endpoint = None  # re-read the discovery document next time
+                raise
+            lifetime = float(token_data.get('expires_in') or 3600)
+            now = time.time()
+            self._token = token_data.get('access_token')
+            self._expires_at = now + lifetime
+            self._refresh_at = now + lifetime * self.refresh_fraction
+            self._schedule(self._refresh_at - now)
+            print("Token retrieved successfully.")
+            return self._token
+
+    def _fetch_token(self) -> Dict[str, Any]:
+        if self._token_endpoint is None:
+            response = requests.get(self.discovery_url, timeout=10)
+            response.raise_for_status()
+            self._token_endpoint = response.json().get('token_endpoint')
+
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        }
+
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        response = requests.post(self._token_endpoint, data=data, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 0), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"⚠️ Background token refresh failed: {e}")
+            with self._lock:
+                self._schedule(self.retry_seconds)
+
 
-    # Check in-memory cache first
-    cache_key = f"{task_type}_token"
-    if cache_key in st.session_state.token_cache:
-        token_data = st.session_state.token_cache[cache_key]
-        if time.time() - token_data['timestamp'] < 3300:  # 55 minutes
-            return token_data['token']
 
-    # Get fresh token
+@st.cache_resource
+def get_token_broker(task_type: str) -> TokenBroker:
+    """One token broker per agent, shared by every Streamlit session in the process"""
     env_map = {
         "csv": ('CSV_DISCOVERY_URL', 'CSV_CLIENT_ID', 'CSV_CLIENT_SECRET'),
         "dashboard": ('DASHBOARD_DISCOVERY_URL', 'DASHBOARD_CLIENT_ID', 'DASHBOARD_CLIENT_SECRET')
     }
 
     env_keys = env_map[task_type]
-    discovery_url = os.getenv(env_keys[0])
-    client_id = os.getenv(env_keys[1])
-    client_secret = os.getenv(env_keys[2])
-
-    # Get token endpoint
-    response = requests.get(discovery_url, timeout=10)
-    token_endpoint = response.json().get('token_endpoint')
-
-    # Get token
-    response = requests.post(
-        token_endpoint,
-        data={
-            'grant_type': 'client_credentials',
-            'client_id': client_id,
-            'client_secret': client_secret,
-        },
-        headers={'Content-Type': 'application/x-www-form-urlencoded'},
-        timeout=10
-    )
+    broker = TokenBroker(os.getenv(env_keys[0]), os.getenv(env_keys[1]), os.getenv(env_keys[2]))
+    if broker.discovery_url:
+        broker.prefetch()
+    return broker
 
-    token = response.json().get('access_token')
-
-    # Cache in session state
-    st.session_state.token_cache[cache_key] = {
-        'token': token,
-        'timestamp': time.time()
-    }
+def get_or_refresh_token(task_type: str) -> str:
+    """Get a valid token from the shared broker"""
+    return get_token_broker(task_type).get_token()
 
-    return token
+# start fetching tokens when the app loads, before the first question
+for _task_type in ("csv", "dashboard"):
+    get_token_broker(_task_type)
 
 # =========================
 # S3 Operations
@@ -142,13 +204,31 @@ def delete_from_s3(s3_key: str) -> bool:
 # =========================
 # Agent Invocation
 # =========================
-def invoke_csv_agent(bearer_token: str, question: str):
-    """Invoke CSV agent"""
+def normalize_agent_result(data) -> str:
+    """Answer text from the different JSON shapes an agent may return"""
+    if isinstance(data, dict):
+        if "result" in data:
+            return str(data["result"]).strip()
+        elif "output" in data:
+            return str(data["output"]).strip()
+        elif "response" in data:
+            return str(data["response"]).strip()
+        return json.dumps(data, indent=2)
+    return str(data).strip()
+
+def stream_csv_agent(bearer_token: str, question: str, outcome: Dict[str, Any], status=None):
+    """
+    Invoke CSV agent and yield answer tokens as they arrive over SSE (for
+    st.write_stream). Tool progress is shown in `status`; the complete answer
+    is left in outcome["answer"].
+    """
     agent_arn = os.getenv('CSV_AGENT_ARN')
     region = os.getenv('CSV_REGION', 'us-east-1')
 
     if not agent_arn:
-        return "❌ CSV_AGENT_ARN not set"
+        outcome["answer"] = "❌ CSV_AGENT_ARN not set"
+        yield outcome["answer"]
+        return
 
     encoded_arn = agent_arn.replace(':', '%3A').replace('/', '%2F')
     url = f"https://bedrock-agentcore.{region}.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
@@ -160,38 +240,45 @@ def invoke_csv_agent(bearer_token: str, question: str):
         "Accept": "text/event-stream"
     }
 
+    streamed = []
     try:
-        response = requests.post(url, headers=headers, json={"prompt": question}, timeout=120)
-        response.raise_for_status()
-
-       # Try parsing JSON
-        try:
-            data = response.json()
-        except json.JSONDecodeError:
-            print("⚠️ Response is not valid JSON, returning raw text.")
-            return response.text.strip()
-
-        # Normalize different response shapes
-        if isinstance(data, dict):
-            if "result" in data:
-                result = data["result"]
-            elif "output" in data:
-                result = data["output"]
-            elif "response" in data:
-                result = data["response"]
-            else:
-                result = json.dumps(data, indent=2)
-        else:
-            result = str(data)
+        with requests.post(url, headers=headers, json={"prompt": question}, timeout=120, stream=True) as response:
+            response.raise_for_status()
 
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # agent answered in one piece
+                try:
+                    outcome["answer"] = normalize_agent_result(response.json())
+                except json.JSONDecodeError:
+                    outcome["answer"] = response.text.strip()
+                yield outcome["answer"]
+                return
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                if not isinstance(event, dict):
+                    streamed.append(str(event))
+                    yield str(event)
+                elif event.get("type") == "token":
+                    streamed.append(event["content"])
+                    yield event["content"]
+                elif event.get("type") == "tool_start" and status is not None:
+                    status.caption(f"🔧 Running {event['name']}...")
+                elif event.get("type") == "tool_end" and status is not None:
+                    status.caption(f"✅ {event['name']} done")
+                elif event.get("type") in ("final", "error"):
+                    outcome["answer"] = event["content"].strip()
+                elif "error" in event:
+                    outcome["answer"] = f"❌ Error: {event['error']}"
+
+        outcome.setdefault("answer", "".join(streamed).strip() or "No response from agent")
         print("✅ Response received successfully!\n")
-        print(result.strip())
-        return result.strip()
-
-        return "No response from agent"
 
     except Exception as e:
-        return f"❌ Error: {e}"
+        outcome["answer"] = f"❌ Error: {e}"
+        yield outcome["answer"]
 
 def invoke_dashboard_agent(bearer_token: str, question: str):
     """Invoke dashboard agent"""
@@ -351,20 +438,28 @@ with tab1:
         with st.chat_message("user"):
             st.markdown(user_input)
 
-        # Get AI response
+        # Get AI response, shown as it is written
         with st.chat_message("assistant"):
-            with st.spinner("🤔 Analyzing..."):
-                try:
-                    token = get_or_refresh_token("csv")
-                    response = invoke_csv_agent(token, user_input)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    add_log("✅ CSV query completed")
-                except Exception as e:
-                    error_msg = f"❌ Error: {e}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                    add_log(f"❌ CSV query failed: {e}")
+            status = st.empty()
+            status.caption("🤔 Analyzing...")
+            answer = st.empty()
+            try:
+                token = get_or_refresh_token("csv")
+                outcome = {}
+                with answer.container():
+                    st.write_stream(stream_csv_agent(token, user_input, outcome, status))
+                status.empty()
+                # the streamed text may include intermediate reasoning turns; keep the final answer
+                response = outcome["answer"]
+                answer.markdown(response)
+                st.session_state.messages.append({"role": "assistant", "content": response})
+                add_log("✅ CSV query completed")
+            except Exception as e:
+                status.empty()
+                error_msg = f"❌ Error: {e}"
+                st.error(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                add_log(f"❌ CSV query failed: {e}")
 
         # Trim history
         if len(st.session_state.messages) > MAX_HISTORY:
@@ -0,0 +1,6 @@
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("mcp_csv_serve", "csv_agent", "dashboard_agent"):
+    sys.path.insert(0, os.path.join(root, directory))
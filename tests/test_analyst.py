@@ -0,0 +1,139 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("ANALYST_STATE_DIR", tempfile.mkdtemp(prefix="analyst-state-"))
+os.environ.setdefault("SIDECAR_FORMAT", "none")
+
+analyst = pytest.importorskip("analyst")
+
+
+@pytest.fixture
+def sales(tmp_path):
+    path = tmp_path / "sales.csv"
+    path.write_text("region,amount\nE,1\nW,2\nE,3\n")
+    name = f"sales_{os.getpid()}_{id(path)}"
+    analyst.aggregate_registry.register(name, str(path), "csv", ["region"], ["amount"])
+    return name, str(path)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT COUNT(*) AS n FROM self WHERE region = 'X'",
+    "SELECT COUNT(amount) AS n FROM self WHERE region = 'X'",
+    "SELECT COUNT(*) AS n FROM self WHERE region = 'E'",
+])
+def test_rollup_counts_match_raw(sales, query):
+    name, path = sales
+    rewritten = analyst.rewrite_for_rollup(query, ["region"], ["amount"])
+    assert rewritten is not None
+    rollup, _ = analyst.run_rollup_query(name, query, rewritten, 0, 100, "records")
+    raw, _ = analyst.run_query([path], query, "csv", "eager", 0, 100, "records")
+    assert rollup["rollup"] == name
+    assert rollup["rows"] == raw["rows"]
+
+
+def test_workload_log_stores_shapes_and_prunes(tmp_path):
+    data = tmp_path / "orders.csv"
+    data.write_text("region,amount\nE,1\n")
+    log = analyst.WorkloadLog(str(tmp_path / "workload.sqlite"), True, max_rows=3)
+    log.prune_every = 1
+    for i in range(5):
+        query = f"SELECT * FROM self WHERE region = 'secret-{i}' AND amount > {i}"
+        log.record([str(data)], "csv", query, "raw", "eager", 1.0, 1, {"row_count": 0}, 0)
+    log.flush()
+    entries = log.entries()
+    assert len(entries) == 3
+    assert log.stats()["pruned"] == 2
+    assert all("secret" not in e["shape"] and "query" not in e for e in entries)
+
+
+def test_depends_on_row_order():
+    assert analyst.depends_on_row_order("SELECT * FROM self LIMIT 5")
+    assert analyst.depends_on_row_order("SELECT a FROM self WHERE b > 1")
+    assert not analyst.depends_on_row_order("SELECT * FROM self ORDER BY a LIMIT 5")
+    assert not analyst.depends_on_row_order("SELECT a, COUNT(*) AS n FROM self GROUP BY a")
+    assert analyst.depends_on_row_order("SELECT * FROM self WHERE note = 'order by'")
+
+
+@pytest.mark.parametrize("mode", ["eager", "lazy", "streaming"])
+def test_unordered_aggregations_page_without_gaps(tmp_path, mode):
+    path = tmp_path / "groups.csv"
+    path.write_text("k,v\n" + "".join(f"g{i % 37},{i}\n" for i in range(1000)))
+    query = "SELECT k, COUNT(*) AS n FROM self GROUP BY k"
+    keys, offset = [], 0
+    while offset is not None:
+        page, _ = analyst.run_query([str(path)], query, "csv", mode, offset, 10, "records")
+        keys += [row["k"] for row in page["rows"]]
+        offset = page.get("next_offset")
+    assert keys == sorted(f"g{i}" for i in range(37))
+
+
+def test_scalable_aggregates_need_aliases():
+    assert analyst.scalable_aggregates("SELECT k, COUNT(*) AS n, SUM(v) s FROM self GROUP BY k") == ["n", "s"]
+    assert analyst.scalable_aggregates("SELECT SUM(v) / COUNT(*) AS mean, COUNT(DISTINCT k) FROM self") == []
+    with pytest.raises(ValueError, match="alias"):
+        analyst.scalable_aggregates("SELECT k, COUNT(*) FROM self GROUP BY k")
+
+
+def test_collect_all_cancellable_matches_separate_collects():
+    import polars as pl
+    source = pl.LazyFrame({"k": ["a", "b", "a"], "v": [1, 2, 3]})
+    plans = [
+        source.group_by("k").agg(pl.col("v").sum()).sort("k"),
+        source.filter(pl.col("v") > 10),
+        source.head(2),
+    ]
+    for packed, plan in zip(analyst.collect_all_cancellable(plans), plans):
+        assert packed.equals(plan.collect())
+        assert packed.schema == plan.collect_schema()
+
+
+def test_stratified_sample_covers_every_group(tmp_path):
+    path = tmp_path / "strata.csv"
+    path.write_text("k,v\n" + "".join(f"{'big' if i % 50 else 'rare'},{i}\n" for i in range(1000)))
+    sample = analyst.sample_frame([str(path)], "csv", 4, "stratified", "k", seed=7)
+    assert sorted(sample["k"].unique()) == ["big", "rare"]
+    assert sample.height == 4
+
+
+def test_metrics_escape_label_values():
+    metrics = analyst.Metrics()
+    metrics.inc("analyst_requests_total", tool='a"b\\c\nd')
+    assert 'analyst_requests_total{tool="a\\"b\\\\c\\nd"} 1' in metrics.render({})
+
+
+def test_query_schema_applies_plan_and_widens(tmp_path):
+    plans = analyst.DtypePlanStore(str(tmp_path), True)
+    df = analyst.pl.DataFrame({"day": ["2024-01-01", "2024-01-02"] * 3, "region": ["E", "W"] * 3, "n": [1, 2] * 3})
+    optimized = plans.apply("orders.csv", df)
+    expected = {"day": analyst.pl.Date, "region": analyst.pl.Categorical, "n": analyst.pl.Int64}
+    for schema in (df.schema, optimized.schema):
+        assert dict(plans.query_schema("orders.csv", schema)) == expected
+    conformed = analyst.DtypePlanStore.conform(df.lazy(), plans.query_schema("orders.csv", df.schema))
+    assert conformed.collect_schema() == plans.query_schema("orders.csv", df.schema)
+
+
+def test_lazy_scans_use_the_dtype_plan(tmp_path, monkeypatch):
+    monkeypatch.setattr(analyst, "dtype_plans", analyst.DtypePlanStore(str(tmp_path / "plans"), True))
+    path = tmp_path / "days.csv"
+    path.write_text("day,region,n\n" + "".join(f"2024-01-0{i % 3 + 1},{'EW'[i % 2]},{i}\n" for i in range(12)))
+    fp = analyst.file_fingerprint(str(path), "csv")
+    key = analyst.result_cache_key("SELECT 1", (fp,))
+    eager = analyst.source_frame([str(path)], "csv", "eager").collect_schema()
+    lazy = analyst.source_frame([str(path)], "csv", "lazy").collect_schema()
+    assert eager == lazy and eager["day"] == analyst.pl.Date
+    assert analyst.result_cache_key("SELECT 1", (fp,)) != key  # the plan now types the results
+
+
+def test_batch_answers_covered_queries_from_rollups(sales):
+    name, path = sales
+    queries = [
+        {"name": "rollup", "query": "SELECT region, SUM(amount) AS s FROM self GROUP BY region ORDER BY region"},
+        {"name": "raw", "query": "SELECT amount FROM self ORDER BY amount"},
+    ]
+    out = asyncio.run(analyst.execute_polars_sql_batch([path], queries, "csv", "eager", None, "records"))
+    assert out[0]["result"]["rollup"] == name
+    assert out[0]["result"]["rows"] == [{"region": "E", "s": 4}, {"region": "W", "s": 2}]
+    assert "rollup" not in out[1]["result"] and len(out[1]["result"]["rows"]) == 3
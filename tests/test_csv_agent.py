@@ -0,0 +1,33 @@
+import pytest
+
+csv_agent = pytest.importorskip("csv_agent")
+
+AnswerCache = csv_agent.AnswerCache
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("top 5 products by revenue", "top 5 products by revenue in east"),
+    ("how many orders were returned", "how many orders were not returned"),
+    ("how many orders were returned", "how many orders weren't returned"),
+    ("average order value by month", "average order value by month for online orders"),
+    ("top 5 products by revenue", "top 10 products by revenue"),
+    ("revenue of orders not shipped but returned", "revenue of orders not returned but shipped"),
+    ("how many orders were shipped and returned", "how many orders were shipped or returned"),
+    ("top 5 customers by orders", "top 5 orders by customers"),
+    ("revenue in 2023 compared to 2024", "revenue in 2024 compared to 2023"),
+])
+def test_answer_cache_misses_different_questions(stored, asked):
+    cache = AnswerCache()
+    cache.store("fp", stored, "answer")
+    assert cache.lookup("fp", asked) is None
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("top 5 products by revenue", "show me the highest 5 products by revenue"),
+    ("average order value by month", "Mean order value per month?"),
+])
+def test_answer_cache_hits_rephrased_questions(stored, asked):
+    cache = AnswerCache()
+    cache.store("fp", stored, "answer")
+    assert cache.lookup("fp", asked) == "answer"
+    assert cache.lookup("other-fp", asked) is None
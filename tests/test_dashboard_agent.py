@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+dashboardagent = pytest.importorskip("dashboardagent")
+
+SQLExecutor = dashboardagent.SQLExecutor
+
+
+def entry(name, rows):
+    return {"name": name, "result": {"columns": list(rows[0]), "rows": rows}}
+
+
+def test_batch_entries_one_json_string_per_query():
+    data = [json.dumps(entry("0", [{"n": 1}])), json.dumps(entry("1", [{"n": 2}]))]
+    assert [e["name"] for e in SQLExecutor._batch_entries(data)] == ["0", "1"]
+
+
+def test_batch_entries_single_query_string():
+    data = json.dumps(entry("0", [{"n": 1}]))
+    entries = SQLExecutor._batch_entries(data)
+    assert len(entries) == 1
+    assert SQLExecutor._rows(entries[0]["result"]) == [{"n": 1}]
+
+
+def test_batch_entries_decoded_list():
+    data = [entry("0", [{"n": 1}]), {"name": "1", "error": "bad query"}]
+    assert SQLExecutor._batch_entries(data)[1]["error"] == "bad query"